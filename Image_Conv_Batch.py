@@ -0,0 +1,514 @@
+"""Batch driver and headless command-line converter.
+
+BatchRunner is the batch loop shared with the GUI. Run as a script, this
+module converts images without importing tkinter, so it works on servers
+without a display and starts in roughly the time it takes to import Python
+and Pillow.
+
+Example:
+    python Image_Conv_Batch.py "photos/*.jpg" scans/ -r -f WEBP -q 80 \\
+        --size-mode custom_size --width 1600 --height 1600 -o out/
+"""
+import argparse
+import glob
+import itertools
+import os
+import sys
+
+from Image_Conv_Engine import (IMAGE_EXTENSIONS, OUTPUT_FORMATS, SIZE_MODES, ICO_SIZES,
+                               DEFAULT_PROFILE, RESAMPLE_FILTERS, RESAMPLE_PROFILES,
+                               DEFAULT_DURABILITY, DURABILITY_MODES, DEFAULT_EFFORT, EFFORT_PRESETS,
+                               DEFAULT_PASSTHROUGH, PASSTHROUGH_MODES,
+                               default_memory_budget, parse_ico_sizes,
+                               ConversionJob, ConversionSettings, FanOutJob, OutputNames, VariantSet,
+                               iter_image_files, run_jobs, sync_outputs)
+from Image_Conv_Cache import ManifestCache, settings_fingerprint
+from Image_Conv_Dedup import DEDUP_MODES, DuplicateGrouper
+from Image_Conv_Timing import TimingReport
+
+
+def iter_input_files(inputs, recursive=False, exclude=()):
+    # Directories contribute the image files inside them (the whole tree with
+    # `recursive`, streamed as it is walked, minus the `exclude` directories);
+    # anything else is treated as a path or glob pattern. Only the explicit
+    # file/glob inputs are deduplicated, so walking a big tree doesn't
+    # accumulate a set of every path.
+    seen = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            if recursive:
+                yield from iter_image_files(pattern, exclude=exclude)
+            else:
+                with os.scandir(pattern) as entries:
+                    matches = sorted(entry.path for entry in entries
+                                     if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS)
+                yield from matches
+            continue
+        for path in sorted(glob.glob(pattern, recursive=True)) or [pattern]:
+            if path not in seen:
+                seen.add(path)
+                yield path
+
+
+class BatchResult:
+    def __init__(self):
+        self.successful = 0
+        self.failed = 0
+        self.skipped = 0 # Up to date from an earlier run
+        self.resumed = 0 # Already finished by the interrupted batch being resumed
+        self.deduplicated = 0 # Linked or copied from an identical source's output
+        self.passed_through = {} # "copy"/"hardlink" -> outputs that are the source itself, not re-encoded
+        self.over_budget = 0 # Outputs over the size limit even at quality 1
+        self.failed_files_details = [] # (filename, error message)
+        self.timings = TimingReport() # One FileTiming per source actually converted
+
+
+class ConversionPlan:
+    """A batch captured up front, e.g. by the GUI when Convert is pressed.
+
+    `files` and `folders` are lists of (path, ConversionSettings); folders are
+    walked only when the plan runs. Nothing in here refers back to the widgets,
+    so edits made in the window while a batch runs can't change it.
+    """
+    __slots__ = ("files", "folders", "source_sizes", "output_dir", "workers", "skip_unchanged", "dedup_mode",
+                 "memory_budget", "durability")
+
+    def __init__(self, files, folders, output_dir="", workers=1, skip_unchanged=True, dedup_mode="off",
+                 source_sizes=None, memory_budget=None, durability=DEFAULT_DURABILITY):
+        self.files = files
+        self.folders = folders
+        self.source_sizes = source_sizes or {} # path -> bytes, for files whose size was already known
+        self.output_dir = output_dir
+        self.workers = workers
+        self.skip_unchanged = skip_unchanged
+        self.dedup_mode = dedup_mode
+        self.memory_budget = memory_budget # Bytes of image data the workers may hold at once; None for no limit
+        self.durability = durability # One of DURABILITY_MODES
+
+
+class BatchRunner:
+    """Runs a stream of source files through the worker pool.
+
+    Sources are (file path, settings) pairs, resolved before the run starts;
+    settings is a ConversionSettings, or a VariantSet for several outputs per
+    source. Output names are planned, the re-run manifest consulted and
+    duplicate sources grouped here in the calling process; only real
+    conversions are sent to the workers, as ConversionJob or FanOutJob
+    records. Results are counted per output. Duplicate grouping only applies
+    to single-output sources.
+
+    With a `journal` (Image_Conv_Journal.BatchJournal) every output is logged
+    as it starts and finishes; `resume` is the ResumeState of an interrupted
+    batch, whose finished outputs are passed over. `memory_budget` limits
+    how much image data the workers hold at once (see run_jobs).
+    `durability` says when outputs are fsync'ed: "none", "file" (each one
+    by its worker, as it is written) or "batch" (all of them when the run
+    ends, however it ends).
+    """
+
+    def __init__(self, workers, output_dir="", skip_unchanged=True, dedup_mode="off", cancel_event=None,
+                 journal=None, resume=None, memory_budget=None, durability=DEFAULT_DURABILITY):
+        self.workers = workers
+        self.memory_budget = memory_budget
+        self.durability = durability
+        self.output_dir = output_dir
+        self.manifests = ManifestCache(skip_unchanged=skip_unchanged)
+        self.duplicates = (DuplicateGrouper(dedup_mode, sync=durability == "file")
+                           if dedup_mode != "off" else None)
+        self.cancel_event = cancel_event
+        self.journal = journal
+        self.resume = resume
+        self.result = BatchResult()
+        self.names = OutputNames()
+        self._pending = {} # output path -> (fingerprint, source stat, template name) until the job reports back
+        self._fingerprints = {} # ConversionSettings -> manifest fingerprint
+        self._unsynced = [] # Outputs written so far, for durability "batch"
+
+    def _fingerprint(self, settings):
+        fingerprint = self._fingerprints.get(settings)
+        if fingerprint is None:
+            fingerprint = self._fingerprints[settings] = settings_fingerprint(settings)
+        return fingerprint
+
+    def _plan(self, file_path_str, settings, on_file_done, name=None):
+        # Plan one output; returns (output path, fingerprint, source stat), or None if it is skipped
+        fingerprint = self._fingerprint(settings)
+        partial_output = self.resume.partial.get((file_path_str, name)) if self.resume is not None else None
+        source_stat, output_path, skip = self.manifests.plan_output(
+            file_path_str, settings.target_format, self.output_dir, fingerprint, self.names,
+            partial_output=partial_output, name=name)
+        if skip:
+            self.result.skipped += 1
+            if self.journal is not None:
+                self.journal.finished(file_path_str, True, name)
+            if on_file_done:
+                on_file_done(file_path_str, None, source_stat.st_size)
+            return None
+        self._pending[str(output_path)] = (fingerprint, source_stat, name)
+        if self.journal is not None:
+            self.journal.started(file_path_str, output_path, name)
+        return str(output_path), fingerprint, source_stat
+
+    def _iter_jobs(self, sources, on_file_done):
+        resume_done = self.resume.done if self.resume is not None else ()
+        for file_path_str, settings in sources:
+            if (file_path_str.endswith(".part") or self.names.is_output(file_path_str)
+                    or self.manifests.is_output(file_path_str)):
+                # A lazy walk can reach files this batch is writing: its
+                # temporary files, or outputs already claimed or written;
+                # outputs of earlier runs aren't sources either
+                if on_file_done:
+                    on_file_done(file_path_str, None, None)
+                continue
+            if isinstance(settings, VariantSet):
+                # Every variant is resumed, planned (and possibly skipped) on its
+                # own; the ones left are produced from a single decode
+                stem = os.path.splitext(os.path.basename(file_path_str))[0]
+                named = [(variant, settings.output_name(stem, variant)) for variant in settings.variants]
+                remaining = [(variant, name) for variant, name in named if (file_path_str, name) not in resume_done]
+                if not remaining:
+                    self.result.resumed += 1
+                    if on_file_done:
+                        on_file_done(file_path_str, None, None)
+                    continue
+                if on_file_done:
+                    for _ in range(len(named) - len(remaining)):
+                        on_file_done(file_path_str, None, None)
+                outputs = []
+                for variant, name in remaining:
+                    planned = self._plan(file_path_str, variant, on_file_done, name)
+                    if planned is not None:
+                        outputs.append((variant, planned[0]))
+                if outputs:
+                    yield FanOutJob(file_path_str, outputs)
+                continue
+
+            if (file_path_str, None) in resume_done:
+                self.result.resumed += 1
+                if on_file_done:
+                    on_file_done(file_path_str, None, None)
+                continue
+
+            planned = self._plan(file_path_str, settings, on_file_done)
+            if planned is None:
+                continue
+            output_path, fingerprint, source_stat = planned
+
+            if self.duplicates is not None and source_stat is not None:
+                leader_output = self.duplicates.find_leader(file_path_str, source_stat.st_size,
+                                                            fingerprint, output_path)
+                if leader_output is not None:
+                    self.duplicates.add_follower(leader_output, file_path_str, output_path)
+                    continue
+
+            yield ConversionJob(file_path_str, settings, output_path)
+
+    def _finish(self, file_path_str, output_path, error, on_file_done):
+        fingerprint, source_stat, name = self._pending.pop(output_path)
+        if error is None:
+            self.result.successful += 1
+            self.names.written(output_path)
+            if self.durability == "batch":
+                self._unsynced.append(output_path)
+            self.manifests.record(file_path_str, fingerprint, source_stat, output_path)
+        else:
+            self.result.failed += 1
+            self.names.release(output_path)
+            self.result.failed_files_details.append((os.path.basename(file_path_str), str(error)))
+            print(f"Error converting {file_path_str}: {error}", file=sys.stderr)
+        if self.journal is not None:
+            self.journal.finished(file_path_str, error is None, name)
+        if on_file_done:
+            on_file_done(file_path_str, error, source_stat.st_size if source_stat is not None else None)
+
+    def _record_timing(self, timing, output_path):
+        source_stat = self._pending[output_path][1]
+        timing.input_bytes = source_stat.st_size if source_stat is not None else 0
+        self.result.timings.add(timing)
+        self.result.over_budget += timing.over_budget
+        for fast_path in filter(None, timing.fast_path.split("+")):
+            self.result.passed_through[fast_path] = self.result.passed_through.get(fast_path, 0) + 1
+
+    def _finish_duplicates(self, finished, on_file_done):
+        for file_path_str, output_path, error in finished:
+            self._finish(file_path_str, output_path, error, on_file_done)
+
+    def run(self, sources, on_file_done=None):
+        """Convert everything in `sources`, calling on_file_done(path, error,
+        source_size) as each file is finished or skipped, and return the
+        BatchResult. source_size is None if the source couldn't be read."""
+        completed = False
+        try:
+            for job, timing, error in run_jobs(self._iter_jobs(sources, on_file_done), self.workers,
+                                               self.cancel_event, self.memory_budget,
+                                               sync=self.durability == "file"):
+                if isinstance(job, FanOutJob):
+                    if timing is not None:
+                        self._record_timing(timing, job.outputs[0][1])
+                    for _, output_path in job.outputs:
+                        self._finish(job.source, output_path, error, on_file_done)
+                    continue
+                if timing is not None:
+                    self._record_timing(timing, job.output_path)
+                self._finish(job.source, job.output_path, error, on_file_done)
+                if self.duplicates is not None:
+                    self._finish_duplicates(self.duplicates.leader_finished(job.output_path, error), on_file_done)
+                    self._finish_duplicates(self.duplicates.take_ready(), on_file_done)
+            if self.duplicates is not None:
+                self._finish_duplicates(self.duplicates.take_ready(), on_file_done)
+                self.result.deduplicated = self.duplicates.avoided
+            completed = self.cancel_event is None or not self.cancel_event.is_set()
+        finally:
+            self.names.release_all() # Outputs a cancelled batch never got to
+            if self._unsynced:
+                sync_outputs(self._unsynced)
+            self.manifests.close()
+            if self.journal is not None:
+                if completed:
+                    self.journal.complete()
+                else:
+                    self.journal.close() # Left behind for a later resume
+        return self.result
+
+
+def parse_widths(value):
+    try:
+        widths = sorted({int(part) for part in value.split(",") if part.strip()}, reverse=True)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid width list: {value!r}")
+    if not widths or widths[-1] <= 0:
+        raise argparse.ArgumentTypeError("widths must be positive")
+    return widths
+
+
+def parse_ico_size_list(value):
+    try:
+        return parse_ico_sizes(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_formats(value):
+    formats = [part.strip().upper() for part in value.split(",") if part.strip()]
+    for target_format in formats:
+        if target_format not in OUTPUT_FORMATS:
+            raise argparse.ArgumentTypeError(f"unsupported format {target_format!r} "
+                                             f"(choose from {', '.join(OUTPUT_FORMATS)})")
+    if not formats:
+        raise argparse.ArgumentTypeError("no formats given")
+    return list(dict.fromkeys(formats))
+
+
+def build_settings(args):
+    common = dict(use_draft=args.use_draft, reducing_gap=args.reducing_gap, ico_sizes=args.ico_sizes,
+                  resample=args.resample, max_bytes=args.max_size and int(args.max_size * 1024),
+                  effort=args.effort, passthrough=args.passthrough)
+    if not args.widths and not args.formats:
+        return ConversionSettings(args.format, args.quality, args.size_mode, args.width, args.height,
+                                  args.percentage, args.maintain_ratio, **common)
+    # Several outputs per source: every format at every width
+    formats = args.formats or [args.format]
+    if args.widths:
+        variants = [ConversionSettings(target_format, args.quality, "fit_width", width=width, **common)
+                    for target_format in formats for width in args.widths]
+    else:
+        variants = [ConversionSettings(target_format, args.quality, args.size_mode, args.width, args.height,
+                                       args.percentage, args.maintain_ratio, **common)
+                    for target_format in formats]
+    name_template = args.name_template or ("{stem}_{width}w.{ext}" if args.widths else "{stem}.{ext}")
+    return VariantSet(variants, name_template)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Convert and resize images without the GUI.")
+    parser.add_argument("inputs", nargs="*", help="Image files, glob patterns or directories")
+    parser.add_argument("-f", "--format", default="JPEG", type=str.upper, choices=OUTPUT_FORMATS,
+                        help="Target format (default: JPEG)")
+    parser.add_argument("-q", "--quality", default=85, type=int,
+                        help="Quality for JPEG/WEBP/HEIC, 1-100 (default: 85)")
+    parser.add_argument("--max-size", type=float, metavar="KB",
+                        help="Size limit for JPEG/WEBP/HEIC outputs: each is encoded at the highest "
+                             "quality, up to --quality, that fits in KB kilobytes")
+    parser.add_argument("--effort", default=DEFAULT_EFFORT, choices=list(EFFORT_PRESETS),
+                        help="Encoder effort for JPEG/PNG/WEBP: fast encodes quickest, max gives the "
+                             f"smallest files (default: {DEFAULT_EFFORT})")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Include images in all subdirectories of directory inputs")
+    parser.add_argument("-o", "--output-dir", default="",
+                        help="Output directory (default: next to each source file)")
+    parser.add_argument("--size-mode", default="keep_original", choices=SIZE_MODES)
+    parser.add_argument("--width", default=800, type=int, help="Width for custom_size (default: 800)")
+    parser.add_argument("--height", default=600, type=int, help="Height for custom_size (default: 600)")
+    parser.add_argument("--percentage", default=50.0, type=float, help="Scale for percentage mode (default: 50)")
+    parser.add_argument("--no-keep-ratio", dest="maintain_ratio", action="store_false",
+                        help="Stretch to exactly --width x --height in custom_size mode")
+    parser.add_argument("--no-draft", dest="use_draft", action="store_false",
+                        help="Always decode JPEGs at full resolution before resizing")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, choices=list(RESAMPLE_PROFILES),
+                        help="Resize speed/quality trade-off: sets the filter and reducing gap "
+                             f"(default: {DEFAULT_PROFILE})")
+    parser.add_argument("--resample", type=str.upper, choices=RESAMPLE_FILTERS,
+                        help="Resampling filter, overriding the profile's")
+    parser.add_argument("--reducing-gap", type=float,
+                        help="Box-reduce until the final filter step is at most this factor; "
+                             "0 resamples from full size (default: from the profile)")
+    parser.add_argument("--ico-sizes", type=parse_ico_size_list, default=ICO_SIZES, metavar="S1,S2,...",
+                        help="Frame sizes for ICO output, at most 256; sizes larger than the image are "
+                             f"skipped (default: {','.join(map(str, sorted(ICO_SIZES)))})")
+    parser.add_argument("--widths", type=parse_widths, metavar="W1,W2,...",
+                        help="Write each source at several widths (e.g. 320,640,1280), decoding it once; "
+                             "replaces --size-mode")
+    parser.add_argument("--formats", type=parse_formats, metavar="F1,F2,...",
+                        help="Write each source in several formats (e.g. WEBP,JPEG), decoding it once")
+    parser.add_argument("--name-template", metavar="TEMPLATE",
+                        help="Output file names for --widths/--formats, using {stem}, {width}, {height}, "
+                             "{format} and {ext} (default: {stem}_{width}w.{ext} with --widths, "
+                             "otherwise {stem}.{ext})")
+    parser.add_argument("--force", action="store_true",
+                        help="Convert every input, even if its output is already up to date")
+    parser.add_argument("--passthrough", default=DEFAULT_PASSTHROUGH, choices=PASSTHROUGH_MODES,
+                        help="Sources already in the target format, size and mode (and, for JPEG, at "
+                             "no higher quality) are copied or hardlinked instead of re-encoded; off "
+                             f"re-encodes them anyway (default: {DEFAULT_PASSTHROUGH})")
+    parser.add_argument("--dedup", default="off", choices=DEDUP_MODES,
+                        help="Convert byte-identical sources once and hardlink or copy the result "
+                             "to the other outputs (default: off)")
+    parser.add_argument("--journal", metavar="FILE",
+                        help="Log progress to FILE so an interrupted batch can be resumed; if FILE "
+                             "already holds an interrupted batch, resume that batch instead")
+    parser.add_argument("--timings", metavar="FILE",
+                        help="Write how long each file spent in each stage to FILE (.csv, or .json), "
+                             "and print a summary")
+    parser.add_argument("--memory-budget", type=float, metavar="MB",
+                        help="Only start conversions while their estimated image memory adds up to at "
+                             "most MB; 0 for no limit (default: half the physical memory)")
+    parser.add_argument("--durability", default=DEFAULT_DURABILITY, choices=DURABILITY_MODES,
+                        help="When outputs are fsync'ed: never, each file as it is written, or all of "
+                             f"them at the end of the batch (default: {DEFAULT_DURABILITY})")
+    parser.add_argument("-j", "--workers", default=os.cpu_count() or 1, type=int,
+                        help="Worker processes (default: number of CPUs)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if not 1 <= args.quality <= 100:
+        parser.error("--quality must be between 1 and 100")
+    if args.max_size is not None and args.max_size <= 0:
+        parser.error("--max-size must be positive")
+    if args.width <= 0 or args.height <= 0:
+        parser.error("--width and --height must be positive")
+    if args.percentage <= 0:
+        parser.error("--percentage must be positive")
+    if args.workers <= 0:
+        parser.error("--workers must be positive")
+    if args.memory_budget is None:
+        args.memory_budget = default_memory_budget()
+    elif args.memory_budget < 0:
+        parser.error("--memory-budget must not be negative")
+    else:
+        args.memory_budget = int(args.memory_budget * 1024 ** 2) or None
+    profile_resample, profile_gap = RESAMPLE_PROFILES[args.profile]
+    if args.resample is None:
+        args.resample = profile_resample
+    if args.reducing_gap is None:
+        args.reducing_gap = profile_gap
+    elif args.reducing_gap == 0:
+        args.reducing_gap = None
+    elif args.reducing_gap <= 1.0:
+        parser.error("--reducing-gap must be 0 (off) or greater than 1")
+
+    settings = build_settings(args)
+    if isinstance(settings, VariantSet):
+        try:
+            settings.output_name("name", settings.variants[0])
+        except (KeyError, IndexError, ValueError) as e:
+            parser.error(f"invalid --name-template: {e}")
+    if args.journal:
+        return run_journaled(parser, args, settings)
+    if not args.inputs:
+        parser.error("no inputs given")
+
+    # Files are turned into jobs as they are enumerated, so conversion starts
+    # while a large directory tree is still being walked.
+    files = iter_input_files(args.inputs, args.recursive, exclude=[args.output_dir])
+    first_files = list(itertools.islice(files, 2))
+    if not first_files:
+        print("No input files found.", file=sys.stderr)
+        return 2
+    # A single-file job never starts the process pool
+    workers = 1 if len(first_files) == 1 else args.workers
+
+    sources = ((file_path_str, settings) for file_path_str in itertools.chain(first_files, files))
+
+    runner = BatchRunner(workers, args.output_dir, skip_unchanged=not args.force, dedup_mode=args.dedup,
+                         memory_budget=args.memory_budget, durability=args.durability)
+    result = runner.run(sources)
+    return report(args, result)
+
+
+def run_journaled(parser, args, settings):
+    # Imported here: the journal module needs this one fully loaded
+    from Image_Conv_Journal import BatchJournal, load_journal
+
+    loaded = load_journal(args.journal)
+    if loaded is not None:
+        plan, resume = loaded
+        print(f"Resuming interrupted batch from {args.journal}: "
+              f"{resume.finished_sources()} of {len(plan.files)} files already done.")
+        journal = BatchJournal(args.journal)
+    else:
+        if not args.inputs:
+            parser.error("no inputs given and no interrupted batch in the journal")
+        # The journal stores the full file list, so it is collected up front
+        files = list(iter_input_files(args.inputs, args.recursive, exclude=[args.output_dir]))
+        if not files:
+            print("No input files found.", file=sys.stderr)
+            return 2
+        plan = ConversionPlan([(file_path_str, settings) for file_path_str in files], [], args.output_dir,
+                              min(args.workers, len(files)), skip_unchanged=not args.force,
+                              dedup_mode=args.dedup, memory_budget=args.memory_budget,
+                              durability=args.durability)
+        resume = None
+        journal = BatchJournal(args.journal, plan)
+
+    runner = BatchRunner(plan.workers, plan.output_dir, skip_unchanged=plan.skip_unchanged,
+                         dedup_mode=plan.dedup_mode, journal=journal, resume=resume,
+                         memory_budget=plan.memory_budget, durability=plan.durability)
+    result = runner.run(plan.files)
+    return report(args, result)
+
+
+def describe_passed_through(passed_through):
+    # e.g. "12 copied, 3 hardlinked without re-encoding"
+    labels = {"copy": "copied", "hardlink": "hardlinked"}
+    counts = ", ".join(f"{count} {labels[fast_path]}" for fast_path, count in sorted(passed_through.items()))
+    return f"{counts} without re-encoding"
+
+
+def report(args, result):
+    summary = (f"Conversion Complete: {result.successful} succeeded, {result.failed} failed, "
+               f"{result.skipped} skipped (unchanged).")
+    if args.dedup != "off":
+        summary += f" {result.deduplicated} conversions avoided (duplicate sources)."
+    if result.resumed:
+        summary += f" {result.resumed} already done before the interruption."
+    if result.passed_through:
+        summary += f" {describe_passed_through(result.passed_through)}."
+    if result.over_budget:
+        summary += f" {result.over_budget} over --max-size even at quality 1."
+    print(summary)
+    if args.timings:
+        if result.timings:
+            print(result.timings.format_summary())
+        try:
+            result.timings.export(args.timings)
+        except OSError as e:
+            print(f"Warning: could not write timings to {args.timings}: {e}", file=sys.stderr)
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
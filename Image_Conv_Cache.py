@@ -0,0 +1,197 @@
+"""Re-run cache: remembers which outputs are already up to date.
+
+Each output directory gets a small append-only manifest (one JSON object per
+line). An entry ties a source file, identified by its absolute path, size and
+modification time, plus a fingerprint of the settings it was converted with,
+to the output file name that was written. On the next run an unchanged source
+with the same settings whose output still exists is skipped, and a changed
+source overwrites its previous output instead of producing name_1, name_2 ...
+Files a manifest lists as outputs are never taken as sources themselves.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from Image_Conv_Engine import DEFAULT_EFFORT, DEFAULT_RESAMPLE, ICO_SIZES, QUALITY_FORMATS
+
+MANIFEST_NAME = ".imgconv_manifest.jsonl"
+
+
+def settings_fingerprint(settings):
+    # Only settings that can change the output take part, so e.g. editing the
+    # width while in percentage mode doesn't invalidate anything.
+    effective = {"format": settings.target_format}
+    if settings.target_format in QUALITY_FORMATS:
+        effective["quality"] = settings.quality
+        if settings.max_bytes is not None:
+            effective["max_bytes"] = settings.max_bytes
+    if settings.effort != DEFAULT_EFFORT:
+        effective["effort"] = settings.effort
+    if settings.passthrough == "off":
+        effective["passthrough"] = "off" # Copies and hardlinks are the same bytes; re-encodes aren't
+    effective["size_mode"] = settings.size_mode
+    if settings.size_mode == "custom_size":
+        effective["size"] = [settings.width, settings.height]
+        effective["maintain_ratio"] = settings.maintain_ratio
+    elif settings.size_mode == "percentage":
+        effective["percentage"] = settings.percentage
+    elif settings.size_mode == "fit_width":
+        effective["width"] = settings.width
+    if settings.ico_sizes is not None and settings.ico_sizes != ICO_SIZES:
+        effective["ico_sizes"] = list(settings.ico_sizes)
+    if settings.size_mode != "keep_original":
+        effective["draft"] = settings.use_draft
+        effective["reducing_gap"] = settings.reducing_gap
+    if settings.resample != DEFAULT_RESAMPLE and (settings.size_mode != "keep_original"
+                                                  or settings.target_format == "ICO"):
+        effective["resample"] = settings.resample
+    encoded = json.dumps(effective, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+class OutputManifest:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.path = self.directory / MANIFEST_NAME
+        self.entries = {} # (source, fingerprint) -> entry dict
+        self.outputs = set() # Normcased names of the outputs recorded here
+        self._file = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                line_count = 0
+                for line in f:
+                    line_count += 1
+                    try:
+                        entry = json.loads(line)
+                        self.entries[(entry["source"], entry["settings"])] = entry
+                        self.outputs.add(os.path.normcase(entry["output"]))
+                    except (ValueError, KeyError, TypeError):
+                        continue # A torn last line from an interrupted run
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"Warning: could not read manifest {self.path}: {e}")
+            return
+        # Later lines supersede earlier ones; compact once the file is mostly stale
+        if line_count > 2 * len(self.entries) + 100:
+            self._rewrite()
+
+    def _rewrite(self):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Warning: could not compact manifest {self.path}: {e}")
+
+    def lookup(self, source, fingerprint):
+        return self.entries.get((source, fingerprint))
+
+    def record(self, source, fingerprint, source_stat, output_path):
+        entry = {
+            "source": source,
+            "settings": fingerprint,
+            "size": source_stat.st_size,
+            "mtime_ns": source_stat.st_mtime_ns,
+            "output": Path(output_path).name,
+        }
+        self.entries[(source, fingerprint)] = entry
+        self.outputs.add(os.path.normcase(entry["output"]))
+        if self._file is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ManifestCache:
+    """The manifests touched by one batch, loaded lazily per output directory.
+
+    With skip_unchanged=False nothing is skipped, but outputs are still
+    recorded and previous output names are still reused.
+    """
+
+    def __init__(self, skip_unchanged=True):
+        self.skip_unchanged = skip_unchanged
+        self._manifests = {}
+
+    def manifest_for(self, output_dir):
+        key = os.path.abspath(output_dir)
+        manifest = self._manifests.get(key)
+        if manifest is None:
+            manifest = OutputManifest(key)
+            self._manifests[key] = manifest
+        return manifest
+
+    def is_output(self, source_path):
+        """True if `source_path` is an output some run recorded in the manifest
+        of its own directory, i.e. the result of a conversion rather than a
+        source to convert again."""
+        source = os.path.abspath(source_path)
+        manifest = self.manifest_for(os.path.dirname(source))
+        return os.path.normcase(os.path.basename(source)) in manifest.outputs
+
+    def check(self, source_path, output_dir, fingerprint):
+        """Return (source_stat, up_to_date_output, previous_output).
+
+        up_to_date_output is set when the source is unchanged since it was
+        converted with these settings and that output still exists; otherwise
+        previous_output is the path an earlier run wrote for it, if any.
+        A source that can't be stat'ed gives (None, None, None) and is left
+        for the conversion itself to report.
+        """
+        source = os.path.abspath(source_path)
+        output_dir = output_dir or os.path.dirname(source)
+        try:
+            source_stat = os.stat(source)
+        except OSError:
+            return None, None, None
+        entry = self.manifest_for(output_dir).lookup(source, fingerprint)
+        if entry is None:
+            return source_stat, None, None
+        output_path = Path(output_dir) / entry["output"]
+        if (entry["size"] == source_stat.st_size and entry["mtime_ns"] == source_stat.st_mtime_ns
+                and output_path.exists()):
+            return source_stat, output_path, None
+        return source_stat, None, output_path
+
+    def plan_output(self, source_path, target_format, output_dir, fingerprint, names, partial_output=None,
+                    name=None):
+        """Return (source_stat, output_path, skip) for one source file.
+
+        `partial_output` is an output an interrupted run was writing for this
+        source; unless the manifest shows it was finished, it is overwritten.
+        `name` overrides the default "<stem>.<ext>" output file name. New
+        output paths come from `names`, the batch's Image_Conv_Engine.OutputNames.
+        """
+        source_stat, up_to_date_output, previous_output = self.check(source_path, output_dir, fingerprint)
+        if up_to_date_output is not None:
+            if self.skip_unchanged:
+                return source_stat, up_to_date_output, True
+            previous_output = up_to_date_output
+        elif partial_output is not None:
+            previous_output = partial_output
+        output_path = names.allocate(source_path, target_format, output_dir, preferred=previous_output, name=name)
+        return source_stat, output_path, False
+
+    def record(self, source_path, fingerprint, source_stat, output_path):
+        if source_stat is None:
+            return
+        output_path = Path(output_path)
+        self.manifest_for(output_path.parent).record(os.path.abspath(source_path), fingerprint,
+                                                     source_stat, output_path)
+
+    def close(self):
+        for manifest in self._manifests.values():
+            manifest.close()
@@ -0,0 +1,86 @@
+"""Detects byte-identical source images within a batch.
+
+Identical sources converted with identical settings give identical outputs,
+so only the first of each group (the leader) is converted; the others
+(followers) are hardlinked or copied from the leader's output once it is done.
+
+Files are only hashed when another source of the same size and settings has
+already been seen, so a batch without duplicates costs one dict lookup per
+file and no extra reads.
+"""
+import hashlib
+
+from Image_Conv_Engine import copy_output
+
+DEDUP_MODES = ["off", "hardlink", "copy"]
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def materialize_duplicate(leader_output, follower_output, mode, sync=False):
+    # Replaces the follower's claim (or its earlier output) in one rename, like any other output
+    copy_output(leader_output, str(follower_output), link=mode == "hardlink", sync=sync)
+
+
+class DuplicateGrouper:
+    def __init__(self, mode="hardlink", sync=False):
+        self.mode = mode
+        self.sync = sync # fsync each follower as it is made (durability "file")
+        self.avoided = 0
+        self._candidates = {} # (size, fingerprint) -> [[source, digest or None, leader output]]
+        self._followers = {} # leader output -> [(follower source, follower output)]
+        self._finished = {} # leader output -> error (None on success)
+        self._ready = [] # (follower source, follower output, error) not yet reported
+
+    def find_leader(self, source_path, source_size, fingerprint, output_path):
+        """Return the output path of an identical source already in the batch,
+        or None, in which case this source becomes a leader itself."""
+        candidates = self._candidates.setdefault((source_size, fingerprint), [])
+        digest = None
+        if candidates:
+            try:
+                digest = file_digest(source_path)
+                for candidate in candidates:
+                    if candidate[1] is None:
+                        candidate[1] = file_digest(candidate[0])
+                    if candidate[1] == digest:
+                        return candidate[2]
+            except OSError:
+                return None # Let the conversion itself report unreadable files
+        candidates.append([source_path, digest, str(output_path)])
+        return None
+
+    def add_follower(self, leader_output, source_path, output_path):
+        output_path = str(output_path)
+        if leader_output in self._finished:
+            self._ready.append(self._materialize(leader_output, source_path, output_path,
+                                                 self._finished[leader_output]))
+        else:
+            self._followers.setdefault(leader_output, []).append((source_path, output_path))
+
+    def leader_finished(self, leader_output, error):
+        """Record a leader's result and return its followers as
+        (source, output, error) now that their outputs are materialised."""
+        self._finished[leader_output] = error
+        return [self._materialize(leader_output, source_path, output_path, error)
+                for source_path, output_path in self._followers.pop(leader_output, [])]
+
+    def take_ready(self):
+        ready, self._ready = self._ready, []
+        return ready
+
+    def _materialize(self, leader_output, source_path, output_path, leader_error):
+        if leader_error is not None:
+            return source_path, output_path, leader_error
+        try:
+            materialize_duplicate(leader_output, output_path, self.mode, self.sync)
+            self.avoided += 1
+            return source_path, output_path, None
+        except OSError as e:
+            return source_path, output_path, e
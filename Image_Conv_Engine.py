@@ -0,0 +1,1282 @@
+"""Conversion engine shared by the GUI and the command-line batch tool.
+
+Nothing in here may import tkinter: this module is loaded by worker processes
+and by headless batch jobs, where the Tk start-up cost (or a missing display)
+is not acceptable.
+"""
+import io
+import math
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from PIL import Image
+
+from Image_Conv_Stream import BAND_BYTES, band_source, open_unchecked, should_stream, stream_resize
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIC_SUPPORT = True
+except ImportError:
+    HEIC_SUPPORT = False
+
+OUTPUT_FORMATS = ["JPEG", "PNG", "WEBP", "BMP", "TIFF", "GIF", "ICO"]
+if HEIC_SUPPORT:
+    OUTPUT_FORMATS.append("HEIC")
+
+QUALITY_FORMATS = ["JPEG", "WEBP", "HEIC"]
+SIZE_MODES = ["keep_original", "custom_size", "percentage", "fit_width"]
+
+# What FileTiming records: open/decode, resize, mode conversion, encode, write
+STAGES = ("decode", "resize", "convert", "encode", "write")
+
+# Resizes shrink by integer box reduction until the remaining step is at most
+# this factor, then apply the real filter. 2.0 is what Image.thumbnail uses and
+# is very close to resampling the full image; 3.0 and up is indistinguishable
+# from it. None disables the reduction step.
+DEFAULT_REDUCING_GAP = 2.0
+
+# Resampling filters, fastest first, by their Image.Resampling names
+RESAMPLE_FILTERS = ["NEAREST", "BOX", "BILINEAR", "HAMMING", "BICUBIC", "LANCZOS"]
+DEFAULT_RESAMPLE = "LANCZOS"
+# Named (filter, reducing gap) pairs. "balanced" is what every resize used
+# before filters were selectable; see the README for measured throughput.
+RESAMPLE_PROFILES = {
+    "fast": ("BILINEAR", 1.5),
+    "balanced": ("LANCZOS", 2.0),
+    "best": ("LANCZOS", None),
+}
+DEFAULT_PROFILE = "balanced"
+
+# Encoder effort: extra save() options per format, from fastest to smallest
+# output. "balanced" keeps what JPEG and WebP always used; PNG "balanced" is
+# zlib's default level, since optimize=True (now "max") takes over ten times
+# as long for about 10% less. See the README for measured numbers.
+EFFORT_PRESETS = {
+    "fast": {"JPEG": {}, "PNG": {"compress_level": 1}, "WEBP": {"method": 0}},
+    "balanced": {"JPEG": {"optimize": True}, "PNG": {}, "WEBP": {}},
+    "max": {"JPEG": {"optimize": True, "progressive": True}, "PNG": {"optimize": True}, "WEBP": {"method": 6}},
+}
+EFFORT_FORMATS = ["JPEG", "PNG", "WEBP"]
+DEFAULT_EFFORT = "balanced"
+
+# Size budgets: the quality search stops at the first encode that is at most
+# this fraction under the budget, and is guided by a sample of about
+# SAMPLE_PIXELS
+SIZE_TOLERANCE = 0.05
+SAMPLE_PIXELS = 256 * 256
+
+# When outputs are fsync'ed: never (left to the OS), each file as it is
+# written, or every output once at the end of the batch
+DURABILITY_MODES = ["none", "file", "batch"]
+DEFAULT_DURABILITY = "none"
+
+# Sources that are already what the output should be (see can_pass_through)
+# are copied or hardlinked instead of converted; "off" always re-encodes
+PASSTHROUGH_MODES = ["off", "copy", "hardlink"]
+DEFAULT_PASSTHROUGH = "copy"
+
+# libjpeg's standard luminance quantization table, which Pillow scales by
+# the quality; only its sum is used, so the order doesn't matter
+_JPEG_LUMA_TABLE = (16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+                    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+                    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+                    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99)
+
+# Frame sizes written into .ico files unless others are chosen; 256 is the format's maximum
+ICO_SIZES = (256, 128, 64, 48, 32, 16)
+MAX_ICO_SIZE = 256
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp", ".gif"}
+HEIC_EXTENSIONS = {".heic", ".heif"}
+if HEIC_SUPPORT:
+    IMAGE_EXTENSIONS |= HEIC_EXTENSIONS
+
+
+def iter_image_files(root_dir, extensions=IMAGE_EXTENSIONS, exclude=()):
+    """Yield image file paths under `root_dir`, recursively, as they are found.
+
+    Uses os.scandir with an explicit stack so a huge tree is streamed one
+    directory at a time instead of being collected (or recursed) up front.
+    Unreadable directories are skipped, and so are the subdirectories listed
+    in `exclude` (e.g. a batch's output directory inside the tree it walks).
+    """
+    excluded = {_path_key(path) for path in exclude if path}
+    pending_dirs = [os.fspath(root_dir)]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        try:
+            entries = os.scandir(current_dir)
+        except OSError:
+            continue
+        subdirs = []
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not excluded or _path_key(entry.path) not in excluded:
+                            subdirs.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file():
+                        yield entry.path
+                except OSError:
+                    continue
+        # Reverse so subdirectories are visited in listing order
+        pending_dirs.extend(reversed(subdirs))
+
+
+def output_extension(target_format):
+    return target_format.lower()
+
+
+class OutputNames:
+    """Hands out output paths for one batch: "<stem>.<ext>" (or a given
+    name) in the output directory, with _1, _2 ... added on collisions.
+
+    Each output directory is listed once, the first time a name is wanted
+    in it; after that collisions are resolved against the in-memory index,
+    and a per-name counter carries on from the last suffix handed out, so
+    a thousand sources called IMG_0001.jpg don't probe _1 to _999 each.
+    Every new name is claimed by creating an empty file with O_EXCL, which
+    fails if anything else (another batch, another program) created it
+    since the listing; the allocator then moves on to the next suffix.
+    Names are handed out by the batch process itself, before the jobs go
+    to the workers, so two workers can never be given the same path.
+
+    A claimed file stays empty until its conversion writes it. Claims whose
+    conversion failed or never ran must be given back with release() or
+    release_all(), which delete them if they are still empty; only files
+    this batch created itself are ever deleted. A batch that is killed
+    can't give its claims back. An empty file on disk can't be told apart
+    from one the user made, so it is treated as taken like any other; the
+    claims of a killed batch are only reused when it is resumed from its
+    journal, which recorded them (see `preferred`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._taken = {} # directory -> normcased names present or handed out
+        self._next_suffix = {} # (directory, normcased name) -> next counter to try
+        self._handed_out = set() # Paths given out in this batch
+        self._claimed = set() # Empty files created by claims and not yet written
+
+    def _names_in(self, directory):
+        key = _path_key(directory)
+        taken = self._taken.get(key)
+        if taken is None:
+            try:
+                with os.scandir(directory) as entries:
+                    taken = {os.path.normcase(entry.name) for entry in entries}
+            except FileNotFoundError:
+                taken = set()
+                os.makedirs(directory, exist_ok=True)
+            self._taken[key] = taken
+        return taken
+
+    def _claim(self, path):
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        self._claimed.add(_path_key(path))
+        return True
+
+    def allocate(self, source_path, target_format, output_dir, preferred=None, name=None):
+        """Return the output path for `source_path`. `preferred` is an earlier
+        output of this same source (from the re-run manifest, or a claim the
+        interrupted batch's journal recorded), which is reused and overwritten
+        unless another file of the batch already got it or it is the source
+        itself."""
+        with self._lock:
+            if (preferred is not None and _path_key(preferred) not in self._handed_out
+                    and _path_key(preferred) != _path_key(source_path)):
+                preferred = os.fspath(preferred)
+                self._handed_out.add(_path_key(preferred))
+                self._names_in(os.path.dirname(preferred)).add(os.path.normcase(os.path.basename(preferred)))
+                return Path(preferred)
+            source_path = Path(source_path)
+            directory = os.fspath(output_dir) if output_dir else os.fspath(source_path.parent)
+            if name is None:
+                name = f"{source_path.stem}.{output_extension(target_format)}"
+            taken = self._names_in(directory)
+            name_stem, name_ext = os.path.splitext(name)
+            key = (_path_key(directory), os.path.normcase(name))
+            counter = self._next_suffix.get(key, 0) # 0 stands for the plain name
+            while True:
+                candidate = f"{name_stem}_{counter}{name_ext}" if counter else name
+                counter += 1
+                folded = os.path.normcase(candidate)
+                if folded in taken:
+                    continue
+                taken.add(folded)
+                path = os.path.join(directory, candidate)
+                if self._claim(path):
+                    self._next_suffix[key] = counter
+                    self._handed_out.add(_path_key(path))
+                    return Path(path)
+
+    def is_output(self, path):
+        # True if `path` was handed out as an output of this batch
+        with self._lock:
+            return _path_key(path) in self._handed_out
+
+    def written(self, path):
+        # Its conversion wrote the file; it is no longer a placeholder
+        with self._lock:
+            self._claimed.discard(_path_key(path))
+
+    def release(self, path):
+        """Give back a claimed name whose conversion failed: the empty file
+        created for it is deleted."""
+        with self._lock:
+            if _path_key(path) in self._claimed:
+                self._claimed.discard(_path_key(path))
+                _remove_if_empty(path)
+
+    def release_all(self):
+        # End of the batch: drop the claims of outputs that were never written
+        with self._lock:
+            for path in self._claimed:
+                _remove_if_empty(path)
+            self._claimed.clear()
+
+
+def _path_key(path):
+    # Paths compare equal however they were spelled (and case-blind on Windows)
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _remove_if_empty(path):
+    try:
+        if os.stat(path).st_size == 0:
+            os.unlink(path)
+    except OSError:
+        pass
+
+
+def parse_ico_sizes(value):
+    # "16, 32,48" -> (48, 32, 16); raises ValueError for anything else
+    sizes = {int(part) for part in str(value).replace(" ", "").split(",") if part}
+    if not sizes or min(sizes) <= 0 or max(sizes) > MAX_ICO_SIZE:
+        raise ValueError(f"Icon sizes must be between 1 and {MAX_ICO_SIZE}")
+    return tuple(sorted(sizes, reverse=True))
+
+
+def fit_within(size, box):
+    # Largest size with the same aspect ratio that fits in `box`, rounded the
+    # same way Image.thumbnail does. Images that already fit are left alone.
+    width, height = size
+    x, y = map(math.floor, box)
+    if x >= width and y >= height:
+        return size
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+
+def compute_target_size(size, size_mode, width, height, percentage, maintain_ratio):
+    # Final output dimensions for an image of `size`, or None to keep it as is
+    if size_mode == "custom_size":
+        new_w = int(width)
+        new_h = int(height)
+        if maintain_ratio:
+            return fit_within(size, (new_w, new_h))
+        return new_w, new_h
+    elif size_mode == "percentage":
+        # Percentage inherently maintains ratio since it's applied to both w/h
+        scale = float(percentage) / 100.0
+        new_w = int(size[0] * scale)
+        new_h = int(size[1] * scale)
+        if new_w > 0 and new_h > 0:
+            return new_w, new_h
+    elif size_mode == "fit_width":
+        # At most `width` wide, height following the aspect ratio; never enlarged
+        return fit_within(size, (int(width), size[1]))
+    return None
+
+
+def output_size(source_size, settings):
+    # What `source_size` is resized to for `settings`, before any ICO frames are made
+    return _output_size(source_size, settings.target_format, settings.size_mode, settings.width,
+                        settings.height, settings.percentage, settings.maintain_ratio, settings.ico_sizes)
+
+
+def _output_size(source_size, target_format, size_mode, width, height, percentage, maintain_ratio, ico_sizes):
+    new_size = compute_target_size(source_size, size_mode, width, height, percentage, maintain_ratio)
+    if target_format == "ICO":
+        # Nothing bigger than the largest icon frame is ever needed
+        largest = min(max(ico_sizes or ICO_SIZES), MAX_ICO_SIZE)
+        new_size = fit_within(new_size or source_size, (largest, largest))
+    return new_size or source_size
+
+
+def bytes_per_pixel(mode):
+    # Pillow's in-memory footprint: RGB, LA and the like are stored padded to 4 bytes
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    return 4
+
+
+def conversion_copies(mode, target_format):
+    # Full-size images prepare_for_format (or the encoder) makes for `mode`
+    if target_format == "GIF":
+        return 0 if mode in ("P", "L") else 1 # Quantized while saving
+    return len(plan_conversion(mode, target_format, transparency=True))
+
+
+def estimate_memory(source_format, source_size, source_mode, settings_list, streamable=False):
+    """Rough peak bytes of image data held while converting one source to
+    every ConversionSettings in `settings_list`, from its header alone.
+
+    Counts the decoded image (at the JPEG draft scale, if one applies), the
+    box-reduced copy and two-pass resample buffer of the first resize and
+    every resized output. On top of that comes the costliest output's mode
+    conversion copies (e.g. the white RGB background of an alpha flatten)
+    and encoded buffer, taken as big as the pixels for BMP and TIFF
+    and half that for compressed formats. It is meant to err on the high side.
+    A `streamable` source that will be resized band by band only counts a
+    band (and its reduced copy) instead of the decoded image.
+    """
+    bpp = bytes_per_pixel(source_mode)
+    targets = {output_size(source_size, settings) for settings in settings_list}
+    largest = max(targets, key=lambda size: size[0] * size[1])
+
+    def saving(settings):
+        width, height = output_size(source_size, settings)
+        pixels = width * height
+        encoded = pixels * bpp if settings.target_format in ("BMP", "TIFF") else pixels * bpp // 2
+        return conversion_copies(source_mode, settings.target_format) * pixels * 4 + encoded
+
+    outputs = (sum(size[0] * size[1] * bpp for size in targets if size != source_size)
+               + max(saving(settings) for settings in settings_list))
+    if streamable and should_stream(source_size, source_mode, largest):
+        return 5 * BAND_BYTES // 2 + outputs # A band, its trimmed copy and the reduced band
+
+    decoded = source_size
+    if (source_format == "JPEG" and all(settings.use_draft for settings in settings_list)
+            and largest[0] < source_size[0] and largest[1] < source_size[1]):
+        scale = 8
+        while scale > 1 and (math.ceil(source_size[0] / scale) < largest[0]
+                             or math.ceil(source_size[1] / scale) < largest[1]):
+            scale //= 2
+        decoded = (math.ceil(source_size[0] / scale), math.ceil(source_size[1] / scale))
+    total = decoded[0] * decoded[1] * bpp
+
+    if largest != source_size:
+        gap = settings_list[0].reducing_gap
+        factor = int(min(decoded[0] / largest[0], decoded[1] / largest[1]) / gap) if gap else 1
+        if factor > 1:
+            total += (decoded[0] // factor) * (decoded[1] // factor) * bpp
+        total += largest[0] * (decoded[1] // max(factor, 1)) * bpp
+    return total + outputs
+
+
+def read_header(path):
+    # (format, size, mode, streamable) from the file header, or None if it can't be read
+    try:
+        img, _ = open_source(path)
+        with img:
+            return img.format, img.size, img.mode, band_source(img) is not None
+    except Exception:
+        return None
+
+
+def open_source(path):
+    """Image.open `path` for conversion; returns (image, checked).
+
+    A TIFF, BMP or PPM over Pillow's decompression-bomb limit is opened
+    anyway, with checked False: it may only be streamed (see
+    streamed_source), never decoded whole.
+    """
+    try:
+        return Image.open(path), True
+    except Image.DecompressionBombError:
+        img = open_unchecked(path)
+        if img is None:
+            raise
+        return img, False
+
+
+def streamed_source(img, checked, new_size):
+    """The BandSource to resize `img` to `new_size` through, band by band,
+    or None to decode it whole. Big sources are streamed when they can be;
+    one over the decompression-bomb limit must be, or this raises."""
+    source = None
+    if new_size is not None and new_size[0] <= img.width and new_size[1] <= img.height and new_size != img.size:
+        if not checked or should_stream(img.size, img.mode, new_size):
+            source = band_source(img)
+    if source is None and not checked:
+        raise Image.DecompressionBombError(
+            f"Image size ({img.width}x{img.height}) is over the decompression bomb limit and "
+            f"it can't be read in bands: only shrinking uncompressed, PackBits or Deflate TIFFs, BMPs "
+            f"and PPMs that large is supported")
+    return source
+
+
+def estimate_job_memory(job):
+    # Estimated peak bytes of a ConversionJob or FanOutJob; 0 if the source
+    # can't be read (the worker will report the error)
+    header = read_header(job.source)
+    if header is None:
+        return 0
+    if isinstance(job, FanOutJob):
+        settings_list = [settings for settings, _ in job.outputs]
+    else:
+        settings_list = [job.settings]
+    source_format, source_size, source_mode, streamable = header
+    return estimate_memory(source_format, source_size, source_mode, settings_list, streamable)
+
+
+def default_memory_budget():
+    # Half the physical memory, or None (no limit) where it can't be found out
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def draft_for_size(img, new_size):
+    # For a freshly opened JPEG being shrunk, let libjpeg decode straight to
+    # the smallest 1/2, 1/4 or 1/8 scale that still covers new_size. Returns
+    # the source box to resize from, or None if the image is decoded in full.
+    if img.format == "JPEG" and new_size[0] < img.width and new_size[1] < img.height:
+        draft_result = img.draft(None, new_size)
+        if draft_result is not None:
+            return draft_result[1]
+    return None
+
+
+def resize_image(img, new_size, reducing_gap=DEFAULT_REDUCING_GAP, use_draft=True, resample=DEFAULT_RESAMPLE,
+                 box=None):
+    # Plan the cheapest route to new_size for a freshly opened image:
+    # 1. JPEG sources decode at a reduced DCT scale (draft) when shrinking.
+    # 2. Whatever is left above `reducing_gap` x the target is taken off with
+    #    Image.reduce, an integer box average that costs one pass over the data.
+    # 3. The final `resample` filter only has to cover the remaining small step.
+    # Pass the `box` from an earlier draft_for_size if the image was drafted
+    # (and loaded) already.
+    if use_draft and box is None:
+        box = draft_for_size(img, new_size)
+    return img.resize(new_size, Image.Resampling[resample], box=box, reducing_gap=reducing_gap)
+
+
+class ConversionSettings:
+    """Resolved settings for one output: target format, quality and resize spec.
+
+    Built once when a batch starts (one instance per distinct target) and
+    shared by every job that uses it. Only the resize fields that matter for
+    `size_mode` are kept; the others are None. Instances are immutable and
+    hashable, and pickle as a plain tuple of their fields.
+    """
+    __slots__ = ("target_format", "quality", "size_mode", "width", "height", "percentage",
+                 "maintain_ratio", "use_draft", "reducing_gap", "ico_sizes", "resample", "max_bytes", "effort",
+                 "passthrough")
+
+    def __init__(self, target_format, quality=85, size_mode="keep_original", width=None, height=None,
+                 percentage=None, maintain_ratio=True, use_draft=True, reducing_gap=DEFAULT_REDUCING_GAP,
+                 ico_sizes=None, resample=DEFAULT_RESAMPLE, max_bytes=None, effort=DEFAULT_EFFORT,
+                 passthrough=DEFAULT_PASSTHROUGH):
+        if resample not in RESAMPLE_FILTERS:
+            raise ValueError(f"Unknown resampling filter: {resample}")
+        if effort not in EFFORT_PRESETS:
+            raise ValueError(f"Unknown encoder effort: {effort}")
+        if passthrough not in PASSTHROUGH_MODES:
+            raise ValueError(f"Unknown pass-through mode: {passthrough}")
+        if size_mode == "custom_size":
+            width, height, percentage, maintain_ratio = int(width), int(height), None, bool(maintain_ratio)
+        elif size_mode == "percentage":
+            width, height, percentage, maintain_ratio = None, None, float(percentage), True
+        elif size_mode == "fit_width":
+            width, height, percentage, maintain_ratio = int(width), None, None, True
+        else:
+            width = height = percentage = None
+            maintain_ratio = True
+        if target_format == "ICO":
+            ico_sizes = tuple(sorted(set(ico_sizes or ICO_SIZES), reverse=True))
+        else:
+            ico_sizes = None
+        # A size budget makes `quality` the highest quality tried (see encode_to_size)
+        max_bytes = int(max_bytes) if max_bytes and target_format in QUALITY_FORMATS else None
+        if target_format not in EFFORT_FORMATS:
+            effort = DEFAULT_EFFORT
+        values = (target_format, int(quality), size_mode, width, height, percentage,
+                  maintain_ratio, bool(use_draft), reducing_gap, ico_sizes, resample, max_bytes, effort,
+                  passthrough)
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def astuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __reduce__(self):
+        return type(self), self.astuple()
+
+    def __eq__(self, other):
+        return isinstance(other, ConversionSettings) and self.astuple() == other.astuple()
+
+    def __hash__(self):
+        return hash(self.astuple())
+
+    def __repr__(self):
+        return f"ConversionSettings{self.astuple()!r}"
+
+
+class ConversionJob:
+    """One planned conversion: source file, its settings and the output path."""
+    __slots__ = ("source", "settings", "output_path")
+
+    def __init__(self, source, settings, output_path):
+        object.__setattr__(self, "source", source)
+        object.__setattr__(self, "settings", settings)
+        object.__setattr__(self, "output_path", output_path)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return type(self), (self.source, self.settings, self.output_path)
+
+    def __repr__(self):
+        return f"ConversionJob({self.source!r}, {self.settings!r}, {self.output_path!r})"
+
+
+class FileTiming:
+    """Where the time went for one source: seconds spent in each stage, and
+    the bytes read and written. Filled in by the worker converting it.
+
+    For a fan-out source the decode and resizes are shared, so the stage
+    times and output bytes cover all of its outputs together.
+    """
+    __slots__ = ("source", "target_format", "input_bytes", "output_bytes", "mode", "quality",
+                 "fast_path", "over_budget") + STAGES + ("_last",)
+
+    def __init__(self, source, target_format, input_bytes=0):
+        self.source = source
+        self.target_format = target_format
+        self.input_bytes = input_bytes
+        self.output_bytes = 0
+        self.mode = "" # Mode change made for the target, e.g. "RGBA>RGB" when alpha was flattened
+        self.quality = None # Quality the output was encoded at; "85+72" for several outputs
+        self.fast_path = "" # "copy" or "hardlink" when the source was passed through; "+"-joined like quality
+        self.over_budget = 0 # Outputs still over their max_bytes limit at quality 1
+        for stage in STAGES:
+            setattr(self, stage, 0.0)
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        # Charge the time since the previous lap to `stage`
+        now = time.perf_counter()
+        setattr(self, stage, getattr(self, stage) + now - self._last)
+        self._last = now
+
+    def add_quality(self, quality):
+        self.quality = quality if self.quality is None else f"{self.quality}+{quality}"
+
+    def add_fast_path(self, fast_path):
+        self.fast_path = f"{self.fast_path}+{fast_path}" if self.fast_path else fast_path
+
+    @property
+    def total(self):
+        return sum(getattr(self, stage) for stage in STAGES)
+
+
+def plan_conversion(mode, target_format, transparency=False):
+    """Return the steps that make an image of `mode` storable as
+    `target_format`, fewest full-size copies first; () if it can be saved
+    as it is. `transparency` tells whether a P image has transparent
+    palette entries.
+
+    Steps are ("convert", mode), or for JPEG ("flatten", mode), which
+    composites an LA or RGBA image onto white in `mode` in one pass, and
+    ("flatten_palette", mode), which composites the palette of a P image
+    onto white and then converts it: 256 colours instead of every pixel.
+    """
+    if target_format == "JPEG":
+        if mode == "RGBA":
+            return (("flatten", "RGB"),)
+        if mode == "LA":
+            return (("flatten", "L"), ("convert", "RGB")) # Flattened at a quarter of the size
+        if mode == "P" and transparency:
+            return (("flatten_palette", "RGB"),)
+        return () if mode == "RGB" else (("convert", "RGB"),)
+    if target_format == "PNG":
+        return () if mode in ("RGBA", "RGB", "P", "L", "LA") else (("convert", "RGBA"),) # Keep transparency
+    if target_format == "HEIC":
+        return () if mode in ("RGB", "RGBA") else (("convert", "RGB"),)
+    if target_format == "ICO":
+        return () if mode == "RGBA" else (("convert", "RGBA"),) # ICOs benefit from RGBA for transparency
+    return ()
+
+
+def _blend_on_white(value, alpha):
+    # Pillow's paste() blend of `value` over 255 with an 8-bit mask, rounding included
+    tmp = 255 * (255 - alpha) + value * alpha + 128
+    return ((tmp >> 8) + tmp) >> 8
+
+
+def flatten_palette(img, mode="RGB"):
+    """Composite a P image with transparency onto white and convert it to
+    `mode`. Returns None for palettes it can't handle (not RGB)."""
+    if img.palette is None or img.palette.mode != "RGB" or "transparency" not in img.info:
+        return None
+    palette = img.getpalette("RGB")
+    transparency = img.info["transparency"]
+    if isinstance(transparency, int):
+        alphas = [0 if index == transparency else 255 for index in range(len(palette) // 3)]
+    else:
+        alphas = list(transparency) + [255] * (len(palette) // 3 - len(transparency))
+    flattened = [_blend_on_white(value, alphas[i // 3]) for i, value in enumerate(palette)]
+    opaque = img.copy() # 1 byte per pixel; `img` and its palette may be shared with other outputs
+    opaque.info.pop("transparency", None)
+    opaque.putpalette(flattened)
+    return opaque.convert(mode)
+
+
+def _palette_transparency(img):
+    # Whether a P image has transparent palette entries
+    return img.mode == "P" and ("transparency" in img.info
+                                or (img.palette is not None and img.palette.mode == "RGBA"))
+
+
+def prepare_for_format(img, target_format):
+    # Convert to a mode the target format can store (see plan_conversion)
+    for step, mode in plan_conversion(img.mode, target_format, _palette_transparency(img)):
+        if step == "convert":
+            img = img.convert(mode)
+        elif step == "flatten":
+            # The RGBA/LA image is its own mask: paste() reads its alpha band in
+            # place, so no band is split off and nothing is converted first
+            background = Image.new(mode, img.size, 255 if mode == "L" else (255, 255, 255))
+            background.paste(img, mask=img)
+            img = background
+        else:
+            flattened = flatten_palette(img, mode)
+            if flattened is None:
+                flattened = prepare_for_format(img.convert("RGBA"), target_format)
+            img = flattened
+    return img
+
+
+def _jpeg_table_sum(quality):
+    # Sum of the luminance quantization table Pillow writes at `quality`
+    scale = 5000 // quality if quality < 50 else 200 - 2 * quality
+    return sum(min(max((value * scale + 50) // 100, 1), 255) for value in _JPEG_LUMA_TABLE)
+
+
+def can_pass_through(img, source_bytes, new_size, target_format, quality, max_bytes=None, effort=DEFAULT_EFFORT):
+    """Whether the opened (not decoded) source `img` can be copied as it is
+    instead of converted: it is a single-image `target_format` file already
+    at `new_size` (None for unchanged) in a mode the format takes as it is,
+    within the size budget, and re-encoding it would only lose quality.
+
+    A JPEG is only copied when it is stored at the requested quality or
+    lower, judged by its luminance quantization table; a higher-quality one
+    is re-encoded, as asked. PNG at "max" effort is re-encoded to shrink it.
+    WebP and HEIC never pass through, since their quality can't be read
+    back, and neither does ICO, whose frames are generated.
+    """
+    if img.format != target_format or target_format in ("WEBP", "HEIC", "ICO"):
+        return False
+    if getattr(img, "n_frames", 1) != 1 or (new_size is not None and new_size != img.size):
+        return False
+    if plan_conversion(img.mode, target_format, _palette_transparency(img)):
+        return False
+    if max_bytes and source_bytes > max_bytes:
+        return False
+    if target_format == "JPEG":
+        tables = getattr(img, "quantization", None)
+        return bool(tables) and 0 in tables and sum(tables[0]) >= _jpeg_table_sum(quality)
+    return target_format != "PNG" or effort != "max"
+
+
+def ico_frames(img, ico_sizes=ICO_SIZES, resample=DEFAULT_RESAMPLE):
+    """Return the frames of an icon, largest first.
+
+    Each frame is reduced from the one before it, so the source is resampled
+    once, for the largest frame. Sizes larger than the image are skipped
+    rather than enlarged; an image smaller than every size becomes the only
+    frame. Non-square images keep their aspect ratio.
+    """
+    frames = []
+    previous = img
+    for size in sorted(set(ico_sizes), reverse=True):
+        if size > MAX_ICO_SIZE or size > max(img.size):
+            continue
+        frame_size = fit_within(img.size, (size, size))
+        if frame_size != previous.size:
+            previous = previous.resize(frame_size, Image.Resampling[resample], reducing_gap=DEFAULT_REDUCING_GAP)
+        frames.append(previous)
+    if not frames:
+        frames.append(img if max(img.size) <= MAX_ICO_SIZE else
+                      img.resize(fit_within(img.size, (MAX_ICO_SIZE, MAX_ICO_SIZE)), Image.Resampling[resample],
+                                 reducing_gap=DEFAULT_REDUCING_GAP))
+    return frames
+
+
+def sync_directory(directory):
+    # Make the renames into `directory` durable. Windows can't open
+    # directories, and doesn't need this
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_output(output_path_str, data, sync=False):
+    """Write `data`, a whole encoded file, to `output_path_str`: in one write
+    to a temporary name in the same directory, then renamed over the target,
+    so an interrupted run never leaves a truncated output under the real
+    name. With `sync` the file and the rename are fsync'ed first."""
+    directory, name = os.path.split(output_path_str)
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}.part")
+    os.makedirs(directory or ".", exist_ok=True)
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, output_path_str)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    if sync:
+        sync_directory(directory)
+
+
+def copy_output(source_path_str, output_path_str, link=False, sync=False):
+    """Put the source file itself at `output_path_str`: a hardlink to it
+    when `link` is set and the filesystem allows one, otherwise a copy. Goes
+    through a temporary name like write_output. Returns "hardlink" or
+    "copy", whichever was made."""
+    directory, name = os.path.split(output_path_str)
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}.part")
+    os.makedirs(directory or ".", exist_ok=True)
+    made = "copy"
+    try:
+        if link:
+            try:
+                os.link(source_path_str, temp_path)
+                made = "hardlink"
+            except OSError:
+                pass # Different filesystem or no hardlink support; fall back to a copy
+        if made == "copy":
+            shutil.copyfile(source_path_str, temp_path)
+            if sync:
+                fd = os.open(temp_path, os.O_RDWR)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        os.replace(temp_path, output_path_str)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    if sync:
+        sync_directory(directory)
+    return made
+
+
+def sync_outputs(paths):
+    """fsync the outputs of a finished batch: every file, then each of
+    their directories once. Files that are gone are passed over."""
+    # Windows only flushes files opened for writing
+    flags = os.O_RDWR if os.name == "nt" else os.O_RDONLY
+    directories = set()
+    for path in paths:
+        try:
+            fd = os.open(path, flags)
+        except OSError:
+            continue
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+        directories.add(os.path.dirname(os.path.abspath(path)))
+    for directory in directories:
+        sync_directory(directory)
+
+
+def _encode(img, target_format, save_kwargs, quality):
+    encoded = io.BytesIO()
+    img.save(encoded, format=target_format, **dict(save_kwargs, quality=quality))
+    return encoded
+
+
+class _QualitySample:
+    """A box-reduced copy of the image being fitted to a size budget. How
+    its encoded size grows with quality predicts the full image's (though
+    not the size itself: samples are denser in detail than their image)."""
+
+    def __init__(self, img, target_format, save_kwargs, factor):
+        self.img = img.reduce(factor)
+        self.scale = img.width * img.height / (self.img.width * self.img.height)
+        self.target_format = target_format
+        self.save_kwargs = save_kwargs
+        self._sizes = {}
+
+    def size(self, quality):
+        # Encoded size at `quality`, scaled up to the full image's pixel count
+        size = self._sizes.get(quality)
+        if size is None:
+            size = self._sizes[quality] = _encode(self.img, self.target_format, self.save_kwargs, quality).tell()
+        return size * self.scale
+
+    def predict(self, max_bytes, low, high):
+        # Highest quality in low..high predicted to fit (low if none is)
+        while low < high:
+            quality = (low + high + 1) // 2
+            if self.size(quality) <= max_bytes:
+                low = quality
+            else:
+                high = quality - 1
+        return low
+
+    def slope(self, quality, max_quality):
+        # d log(size) / d _quality_scale around `quality`
+        other = quality + 5 if quality + 5 <= max_quality else quality - 5
+        return (math.log(self.size(other) / self.size(quality))
+                / (_quality_scale(other) - _quality_scale(quality)))
+
+
+def _quality_scale(quality):
+    # libjpeg's quality -> quantizer scaling, as minus its log. Encoded size
+    # (of WEBP and HEIC too) is much closer to exponential in this than in
+    # the quality itself.
+    return -math.log(5000 / quality if quality < 50 else max(200 - 2 * quality, 1))
+
+
+def _quality_at(scale):
+    # Inverse of _quality_scale, unrounded
+    divisor = math.exp(-scale)
+    return 5000 / divisor if divisor > 100 else (200 - divisor) / 2
+
+
+def encode_to_size(img, target_format, max_bytes, save_kwargs, max_quality=100):
+    """Encode `img` at the highest quality up to `max_quality` whose output
+    is at most `max_bytes`; returns (BytesIO, quality).
+
+    Encoded size grows roughly exponentially with _quality_scale, so the
+    search works on log(size) against that. The first quality is predicted
+    from a sample of about SAMPLE_PIXELS (see _QualitySample), the second
+    extrapolated with the sample's slope, the rest by the secant through
+    the last two encodes, or once the answer is bracketed, by interpolation
+    kept clear of the ends when it lands on the same side twice. The search stops early at an
+    encode that fits within SIZE_TOLERANCE of the budget. If even quality 1
+    is too big, that encode is returned.
+    """
+    low, high = 1, max_quality # The answer is in low..high, if anything fits
+    factor = math.ceil(math.sqrt(img.width * img.height / SAMPLE_PIXELS))
+    sample = _QualitySample(img, target_format, save_kwargs, factor) if factor >= 2 else None
+    quality = sample.predict(max_bytes, low, high) if sample is not None else high
+    log_target = math.log(max_bytes * (1 - SIZE_TOLERANCE / 2)) # Aim for the middle of the tolerance
+    best = smallest = None # (encoded, quality, log size) of the highest that fits / lowest that doesn't
+    history = [] # (_quality_scale, log size) of every encode
+    fitted = [] # Whether each encode fit
+    while True:
+        encoded = _encode(img, target_format, save_kwargs, quality)
+        size = encoded.tell()
+        history.append((_quality_scale(quality), math.log(max(size, 1))))
+        fitted.append(size <= max_bytes)
+        if size <= max_bytes:
+            best = (encoded, quality, history[-1][1])
+            if size >= max_bytes * (1 - SIZE_TOLERANCE):
+                break
+            low = quality + 1
+        else:
+            smallest = (encoded, quality, history[-1][1])
+            high = quality - 1
+        if low > high:
+            break
+        if best is not None and smallest is not None:
+            _, fit_quality, fit_log = best
+            _, over_quality, over_log = smallest
+            fit_scale, over_scale = _quality_scale(fit_quality), _quality_scale(over_quality)
+            quality = round(_quality_at(fit_scale + (log_target - fit_log) / (over_log - fit_log)
+                                        * (over_scale - fit_scale)))
+            # Interpolation can keep landing on the same side of a curved
+            # bracket; when it does, keep clear of the ends so it shrinks fast
+            margin = (high - low) // 4 if fitted[-1] == fitted[-2] else 0
+            quality = min(max(quality, low + margin), high - margin)
+            continue
+        if len(history) >= 2:
+            (scale_1, log_1), (scale_2, log_2) = history[-2:]
+            slope = (log_2 - log_1) / (scale_2 - scale_1)
+        elif sample is not None:
+            slope = sample.slope(quality, max_quality)
+        else:
+            slope = 0
+        if slope > 0:
+            scale, log_size = history[-1]
+            quality = min(max(round(_quality_at(scale + (log_target - log_size) / slope)), low), high)
+        else:
+            quality = (low + high + 1) // 2
+    encoded, quality, _ = best or smallest
+    return encoded, quality
+
+
+def save_image(img_to_save, output_path_str, target_format, quality, ico_sizes=None, resample=DEFAULT_RESAMPLE,
+               timing=None, sync=False, max_bytes=None, effort=DEFAULT_EFFORT):
+    save_kwargs = dict(EFFORT_PRESETS[effort].get(target_format, {}))
+    if target_format in QUALITY_FORMATS:
+        save_kwargs["quality"] = quality
+    elif target_format == "ICO":
+        # Hand Pillow every frame ready-made; otherwise it thumbnails the full
+        # image again for each size
+        frames = ico_frames(img_to_save, ico_sizes or ICO_SIZES, resample)
+        if timing is not None:
+            timing.lap("resize")
+        img_to_save = frames[0]
+        save_kwargs["sizes"] = [frame.size for frame in frames]
+        save_kwargs["append_images"] = frames[1:]
+
+    # Encoded in memory, then written in one go (see write_output)
+    if max_bytes and target_format in QUALITY_FORMATS:
+        encoded, quality = encode_to_size(img_to_save, target_format, max_bytes, save_kwargs, quality)
+        if encoded.tell() > max_bytes:
+            if timing is not None:
+                timing.over_budget += 1
+            print(f"Warning: {output_path_str} is {encoded.tell():,} bytes even at quality {quality}, "
+                  f"over the {max_bytes:,} byte limit")
+    else:
+        encoded = io.BytesIO()
+        img_to_save.save(encoded, format=target_format, **save_kwargs)
+    if timing is not None:
+        if target_format in QUALITY_FORMATS:
+            timing.add_quality(quality)
+        timing.lap("encode")
+    write_output(output_path_str, encoded.getbuffer(), sync)
+    if timing is not None:
+        timing.output_bytes += encoded.tell()
+        timing.lap("write")
+
+
+def convert_single_file(file_path_str, target_format, quality, size_mode, width, height,
+                        percentage, maintain_ratio, output_path_str, use_draft=True,
+                        reducing_gap=DEFAULT_REDUCING_GAP, ico_sizes=None, resample=DEFAULT_RESAMPLE, timing=None,
+                        sync=False, max_bytes=None, effort=DEFAULT_EFFORT, passthrough=DEFAULT_PASSTHROUGH):
+    # Runs in a worker process: open -> resize -> mode convert -> save for one file.
+    # Everything it needs is passed in, so it never touches the Tk widgets.
+    # With a FileTiming, the time spent in each stage is added to it. A source
+    # that is already what the output should be is copied or hardlinked instead
+    # (see can_pass_through), unless `passthrough` is "off".
+    current_path = Path(file_path_str)
+    if not HEIC_SUPPORT and current_path.suffix.lower() in HEIC_EXTENSIONS:
+        raise Exception("HEIC not supported (pillow-heif not installed)")
+
+    img, checked = open_source(current_path)
+    with img:
+        # Apply resizing. The target is worked out from the header size,
+        # before any pixels are decoded.
+        resized_img = img
+        new_size = _output_size(img.size, target_format, size_mode, width, height, percentage, maintain_ratio,
+                                ico_sizes)
+        if passthrough != "off" and can_pass_through(img, os.path.getsize(file_path_str), new_size, target_format,
+                                                     quality, max_bytes, effort):
+            pass_through(file_path_str, output_path_str, passthrough, timing, sync)
+            return output_path_str
+        resizing = new_size != img.size
+        source = streamed_source(img, checked, new_size)
+        if source is not None:
+            # Decoded band by band as it is resized, so the decode counts as resize time
+            if timing is not None:
+                timing.lap("decode")
+            resized_img = stream_resize(source, new_size, resample, reducing_gap)
+        else:
+            box = draft_for_size(img, new_size) if resizing and use_draft else None
+            if timing is not None:
+                img.load() # Decode now, so the decode isn't charged to the resize
+                timing.lap("decode")
+            if resizing:
+                resized_img = resize_image(img, new_size, reducing_gap, False, resample, box)
+        if timing is not None:
+            timing.lap("resize")
+
+        # Handle mode conversion after resizing
+        img_to_save = prepare_for_format(resized_img, target_format)
+        if timing is not None:
+            if img_to_save.mode != resized_img.mode:
+                timing.mode = f"{resized_img.mode}>{img_to_save.mode}"
+            timing.lap("convert")
+        save_image(img_to_save, output_path_str, target_format, quality, ico_sizes, resample, timing, sync,
+                   max_bytes, effort)
+    return output_path_str
+
+
+def pass_through(file_path_str, output_path_str, passthrough, timing=None, sync=False):
+    # Copy or hardlink the source to its output; only its header was read
+    if timing is not None:
+        timing.lap("decode")
+    made = copy_output(file_path_str, output_path_str, passthrough == "hardlink", sync)
+    if timing is not None:
+        timing.add_fast_path(made)
+        timing.output_bytes += os.path.getsize(output_path_str)
+        timing.lap("write")
+
+
+def convert_fan_out(file_path_str, outputs, timing=None, sync=False):
+    """Decode `file_path_str` once and write every (settings, output path) in
+    `outputs` from it.
+
+    The distinct target sizes form a ladder that is generated largest first,
+    each rung resampled from the previous one when it fits inside it, so only
+    the first rung touches the full-resolution image. JPEG sources are draft
+    decoded at the smallest scale that still covers the largest rung.
+    Variants that share a size (e.g. the WEBP and JPEG at 640 px) share the
+    resized image. Variants the source already is (see can_pass_through) are
+    copied or hardlinked; if that is all of them, nothing is decoded.
+    """
+    current_path = Path(file_path_str)
+    if not HEIC_SUPPORT and current_path.suffix.lower() in HEIC_EXTENSIONS:
+        raise Exception("HEIC not supported (pillow-heif not installed)")
+
+    img, checked = open_source(current_path)
+    with img:
+        source_size = img.size
+        source_bytes = os.path.getsize(file_path_str)
+        targets = []
+        passed = []
+        for settings, output_path_str in outputs:
+            new_size = output_size(source_size, settings)
+            if settings.passthrough != "off" and can_pass_through(img, source_bytes, new_size, settings.target_format,
+                                                                  settings.quality, settings.max_bytes,
+                                                                  settings.effort):
+                passed.append((settings.passthrough, output_path_str))
+            else:
+                targets.append((new_size, settings, output_path_str))
+        for passthrough, output_path_str in passed:
+            pass_through(file_path_str, output_path_str, passthrough, timing, sync)
+        if not targets:
+            return [output_path_str for _, output_path_str in outputs]
+        ladder = sorted({size for size, _, _ in targets}, key=lambda size: size[0] * size[1], reverse=True)
+        use_draft = all(settings.use_draft for _, settings, _ in targets)
+        reducing_gap = targets[0][1].reducing_gap
+        resample = targets[0][1].resample
+
+        source = streamed_source(img, checked, ladder[0])
+        box = None
+        if source is None:
+            box = draft_for_size(img, ladder[0]) if use_draft and ladder[0] != source_size else None
+            if timing is not None:
+                img.load()
+        if timing is not None:
+            timing.lap("decode")
+
+        rungs = {}
+        previous = None
+        for size in ladder:
+            if size == source_size:
+                rung = img
+            elif previous is not None and previous.width >= size[0] and previous.height >= size[1]:
+                rung = previous.resize(size, Image.Resampling[resample], reducing_gap=reducing_gap)
+            elif source is not None:
+                rung = stream_resize(source, size, resample, reducing_gap)
+            else:
+                # First rung (or one that doesn't fit in the previous one): from the source
+                rung = resize_image(img, size, reducing_gap, False, resample, box if previous is None else None)
+            rungs[size] = previous = rung
+        if timing is not None:
+            timing.lap("resize")
+
+        for size, settings, output_path_str in targets:
+            img_to_save = prepare_for_format(rungs[size], settings.target_format)
+            if timing is not None:
+                if img_to_save.mode != rungs[size].mode:
+                    timing.mode = f"{rungs[size].mode}>{img_to_save.mode}"
+                timing.lap("convert")
+            save_image(img_to_save, output_path_str, settings.target_format, settings.quality,
+                       settings.ico_sizes, settings.resample, timing, sync, settings.max_bytes, settings.effort)
+    return [output_path_str for _, output_path_str in outputs]
+
+
+class VariantSet:
+    """Several outputs made from each source in one decode: a list of
+    ConversionSettings plus the naming template for their files.
+
+    The template may use {stem}, {width}, {height}, {format} and {ext}; width
+    and height are the requested size (e.g. the 640 of a 640 px rung), or
+    empty when the variant doesn't set one.
+    """
+    __slots__ = ("variants", "name_template")
+
+    def __init__(self, variants, name_template="{stem}_{width}w.{ext}"):
+        object.__setattr__(self, "variants", tuple(variants))
+        object.__setattr__(self, "name_template", name_template)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return type(self), (self.variants, self.name_template)
+
+    def __eq__(self, other):
+        return (isinstance(other, VariantSet) and self.variants == other.variants
+                and self.name_template == other.name_template)
+
+    def __hash__(self):
+        return hash((self.variants, self.name_template))
+
+    def output_name(self, stem, settings):
+        return self.name_template.format(stem=stem, width=settings.width or "", height=settings.height or "",
+                                         format=settings.target_format,
+                                         ext=output_extension(settings.target_format))
+
+
+class FanOutJob:
+    """One source converted to several outputs: `outputs` is a tuple of
+    (ConversionSettings, output path)."""
+    __slots__ = ("source", "outputs")
+
+    def __init__(self, source, outputs):
+        object.__setattr__(self, "source", source)
+        object.__setattr__(self, "outputs", tuple(outputs))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return type(self), (self.source, self.outputs)
+
+    def __repr__(self):
+        return f"FanOutJob({self.source!r}, {self.outputs!r})"
+
+
+def convert_job(job, sync=False):
+    # Worker entry point: everything is already resolved in the job record.
+    # Returns the job's FileTiming. `sync` fsyncs each output as it is written.
+    if isinstance(job, FanOutJob):
+        formats = dict.fromkeys(settings.target_format for settings, _ in job.outputs)
+        timing = FileTiming(job.source, "+".join(formats))
+        convert_fan_out(job.source, job.outputs, timing, sync)
+        return timing
+    settings = job.settings
+    timing = FileTiming(job.source, settings.target_format)
+    convert_single_file(job.source, settings.target_format, settings.quality, settings.size_mode,
+                        settings.width, settings.height, settings.percentage,
+                        settings.maintain_ratio, job.output_path, settings.use_draft,
+                        settings.reducing_gap, settings.ico_sizes, settings.resample, timing, sync,
+                        settings.max_bytes, settings.effort, settings.passthrough)
+    return timing
+
+
+# Memory admission: jobs read ahead of the pool to find ones that fit, and
+# how many younger jobs may overtake the oldest waiting one before it gets
+# the next memory that frees up
+ADMISSION_LOOKAHEAD = 16
+MAX_OVERTAKES = 32
+
+
+def run_jobs(jobs, workers, cancel_event=None, memory_budget=None, sync=False):
+    """Convert `jobs` (ConversionJob records) and yield (job, timing, error)
+    in completion order: the job's FileTiming and None on success, None and
+    the exception on failure.
+
+    `jobs` may be any iterable. With more than one worker only a small window
+    of jobs is kept in flight, so a lazily produced job stream is consumed as
+    the pool frees up instead of being materialised up front.
+
+    With a `memory_budget` (bytes), each job's peak memory is estimated from
+    its source header and jobs only start while the estimates of those
+    running add up to no more than the budget. A job that doesn't fit waits
+    while smaller ones behind it go ahead, up to MAX_OVERTAKES of them; a
+    job bigger than the whole budget runs on its own.
+
+    With `sync` every output is fsync'ed as soon as it is written.
+    """
+    if workers <= 1:
+        # No point paying process start-up for a single worker
+        for job in jobs:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            try:
+                timing = convert_job(job, sync)
+            except Exception as e:
+                yield job, None, e
+                continue
+            yield job, timing, None
+        return
+
+    # Imported here so single-file and single-worker runs don't pay for it
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    job_iter = iter(jobs)
+    if memory_budget:
+        # Only running jobs hold memory, so don't queue any beyond the workers
+        max_in_flight = workers
+        lookahead_size = max(ADMISSION_LOOKAHEAD, workers * 2)
+    else:
+        max_in_flight = workers * 2
+        lookahead_size = 1
+    waiting = deque() # (job, estimated bytes), read ahead of the pool
+    in_flight = {} # future -> (job, estimated bytes)
+    memory_in_use = 0
+    overtakes = 0 # Jobs started ahead of waiting[0]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            exhausted = False
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    exhausted = True
+                    waiting.clear()
+                while not exhausted and len(waiting) < lookahead_size:
+                    job = next(job_iter, None)
+                    if job is None:
+                        exhausted = True
+                        break
+                    waiting.append((job, estimate_job_memory(job) if memory_budget else 0))
+
+                while waiting and len(in_flight) < max_in_flight:
+                    chosen = None
+                    for index, (job, estimate) in enumerate(waiting):
+                        if not memory_budget or not in_flight or memory_in_use + estimate <= memory_budget:
+                            chosen = index
+                            break
+                        if overtakes >= MAX_OVERTAKES:
+                            break # The oldest has waited long enough; hold memory for it
+                    if chosen is None:
+                        break
+                    job, estimate = waiting[chosen]
+                    del waiting[chosen]
+                    overtakes = overtakes + 1 if chosen else 0
+                    memory_in_use += estimate
+                    in_flight[executor.submit(convert_job, job, sync)] = (job, estimate)
+
+                if not in_flight:
+                    return
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, estimate = in_flight.pop(future)
+                    memory_in_use -= estimate
+                    error = future.exception()
+                    yield job, (future.result() if error is None else None), error
+        finally:
+            for future in in_flight:
+                future.cancel()
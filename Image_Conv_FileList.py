@@ -0,0 +1,164 @@
+"""Ordered, indexed model of the files (or folders) selected for conversion.
+
+The GUI used to keep a plain list and rebuild the Treeview from it, matching
+rows by file name, which is quadratic in the number of files. The model is a
+dict keyed by path (insertion ordered), so add/remove/lookup are O(1), and
+diff_rows() works out the minimal set of Treeview changes from the rows the
+tree currently shows. MetadataLoader fills in file details off the GUI thread.
+Nothing in here touches Tk.
+"""
+import os
+import queue
+import threading
+
+from PIL import Image
+
+# FileEntry.size values other than a byte count
+SIZE_MISSING = -1
+SIZE_ERROR = -2
+SIZE_LOADING = -3
+
+
+class FileEntry:
+    __slots__ = ("path", "name", "size", "format", "dimensions", "target_format")
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path) or path
+        self.size = None # Bytes once known, or one of the SIZE_* values; None until requested
+        self.format = None # Container format read from the file header
+        self.dimensions = None # (width, height) read from the file header
+        self.target_format = None # Individual-mode target; None means the default
+
+
+class FileListModel:
+    def __init__(self):
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __contains__(self, path):
+        return path in self._entries
+
+    def get(self, path):
+        return self._entries.get(path)
+
+    def entries(self):
+        return self._entries.values()
+
+    def add(self, path):
+        if path in self._entries:
+            return False
+        self._entries[path] = FileEntry(path)
+        return True
+
+    def add_many(self, paths):
+        # Returns the paths that were not already in the model, in order
+        added = []
+        entries = self._entries
+        for path in paths:
+            if path not in entries:
+                entries[path] = FileEntry(path)
+                added.append(path)
+        return added
+
+    def remove(self, path):
+        return self._entries.pop(path, None) is not None
+
+    def clear(self):
+        self._entries.clear()
+
+
+def diff_rows(shown_rows, wanted_rows):
+    """Compare the rows a Treeview shows with the rows it should show.
+
+    Both are dicts of iid -> (text, values). Returns (to_delete, to_update,
+    to_insert): iids to delete, and (iid, text, values) lists for rows whose
+    content changed and for rows that are new. Unchanged rows are left alone.
+    """
+    to_delete = [iid for iid in shown_rows if iid not in wanted_rows]
+    to_update = []
+    to_insert = []
+    for iid, row in wanted_rows.items():
+        shown = shown_rows.get(iid)
+        if shown is None:
+            to_insert.append((iid, row[0], row[1]))
+        elif shown != row:
+            to_update.append((iid, row[0], row[1]))
+    return to_delete, to_update, to_insert
+
+
+def read_file_metadata(path):
+    """Return (size, format, dimensions) for `path` without decoding pixels.
+
+    Image.open only parses the header, so this costs one stat and one small
+    read. Files Pillow can't identify keep their size with format None.
+    """
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        return SIZE_MISSING, None, None
+    except OSError:
+        return SIZE_ERROR, None, None
+    try:
+        with Image.open(path) as img:
+            return size, img.format, img.size
+    except Exception: # Not an image, unsupported, or over the decompression bomb limit
+        return size, None, None
+
+
+class MetadataLoader:
+    """Reads file metadata on a few daemon threads.
+
+    Results are collected in a queue for the GUI to drain on its own schedule,
+    so updates reach the Treeview in batches instead of one event per file.
+    cancel() drops everything still queued, e.g. when the list is cleared.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.outstanding = 0 # Requests of the current generation not yet drained
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._generation = 0
+        self._threads = []
+
+    def request(self, paths):
+        if not self._threads:
+            for _ in range(self.workers):
+                # Daemon threads: a slow network share must never delay quitting
+                thread = threading.Thread(target=self._run, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        generation = self._generation
+        for path in paths:
+            self._requests.put((generation, path))
+            self.outstanding += 1
+
+    def cancel(self):
+        self._generation += 1
+        self.outstanding = 0
+
+    def _run(self):
+        while True:
+            generation, path = self._requests.get()
+            if generation != self._generation:
+                continue
+            self._results.put((generation, path, read_file_metadata(path)))
+
+    def drain(self, limit):
+        """Return up to `limit` finished (path, (size, format, dimensions)) results."""
+        results = []
+        while len(results) < limit:
+            try:
+                generation, path, metadata = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation == self._generation:
+                self.outstanding -= 1
+                results.append((path, metadata))
+        return results
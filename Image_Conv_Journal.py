@@ -0,0 +1,181 @@
+"""Crash-resumable batch journal.
+
+A journal is an append-only file (one JSON object per line) describing one
+batch: the first line is the whole ConversionPlan, then each output gets a
+"start" line when it is handed to a worker and a "done" line when it is
+finished. A batch that runs to the end deletes its journal; one that is
+cancelled, killed or cut off by a reboot leaves it behind, and
+load_journal() turns it back into the plan plus a ResumeState:
+
+- outputs with a "done" line are not converted again;
+- outputs with only a "start" line were interrupted mid-write, so they are
+  overwritten in place instead of getting a _1, _2 ... sibling.
+
+Multi-output (VariantSet) sources log one start/done pair per output, told
+apart by the output's template name, and are resumed output by output.
+
+Lines are flushed as they are written and fsync'ed at most once a second, so
+a power cut loses at most the last second of progress (which is redone).
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+from Image_Conv_Engine import DEFAULT_DURABILITY, ConversionSettings, VariantSet
+from Image_Conv_Batch import ConversionPlan
+
+JOURNAL_VERSION = 1
+SYNC_INTERVAL = 1.0 # Seconds between fsyncs of the journal
+
+
+def default_journal_path():
+    # Where the GUI keeps the journal of its current (or last interrupted) batch
+    return Path.home() / ".image_converter" / "batch_journal.jsonl"
+
+
+def plan_to_json(plan):
+    # Settings are stored once and referred to by index; a batch has few distinct ones
+    settings_index = {}
+
+    def index_of(settings):
+        if settings not in settings_index:
+            settings_index[settings] = len(settings_index)
+        return settings_index[settings]
+
+    def encode(settings):
+        if isinstance(settings, VariantSet):
+            return {"variants": [list(variant.astuple()) for variant in settings.variants],
+                    "name_template": settings.name_template}
+        return list(settings.astuple())
+
+    files = [[path, index_of(settings)] for path, settings in plan.files]
+    folders = [[path, index_of(settings)] for path, settings in plan.folders]
+    return {
+        "type": "batch",
+        "version": JOURNAL_VERSION,
+        "settings": [encode(settings) for settings in settings_index],
+        "files": files,
+        "folders": folders,
+        "source_sizes": plan.source_sizes,
+        "output_dir": plan.output_dir,
+        "workers": plan.workers,
+        "skip_unchanged": plan.skip_unchanged,
+        "dedup_mode": plan.dedup_mode,
+        "memory_budget": plan.memory_budget,
+        "durability": plan.durability,
+    }
+
+
+def plan_from_json(data):
+    def decode(values):
+        if isinstance(values, dict):
+            return VariantSet([ConversionSettings(*variant) for variant in values["variants"]],
+                              values["name_template"])
+        return ConversionSettings(*values)
+
+    settings = [decode(values) for values in data["settings"]]
+    return ConversionPlan([(path, settings[index]) for path, index in data["files"]],
+                          [(path, settings[index]) for path, index in data["folders"]],
+                          data["output_dir"], data["workers"],
+                          skip_unchanged=data["skip_unchanged"], dedup_mode=data["dedup_mode"],
+                          source_sizes=data["source_sizes"], memory_budget=data.get("memory_budget"),
+                          durability=data.get("durability", DEFAULT_DURABILITY))
+
+
+class ResumeState:
+    def __init__(self):
+        self.done = set() # (source, output name or None) finished (converted, skipped or failed) before the interruption
+        self.partial = {} # (source, output name or None) -> output path being written when it stopped
+
+    def finished_sources(self):
+        # Sources with at least one finished output, for the resume prompt
+        return len({source for source, _ in self.done})
+
+
+def load_journal(path):
+    """Return (plan, ResumeState) for the interrupted batch in `path`, or None
+    if there is no usable journal there."""
+    state = ResumeState()
+    plan = None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    kind = record["type"]
+                    if kind == "batch":
+                        if record.get("version") != JOURNAL_VERSION:
+                            return None
+                        plan = plan_from_json(record)
+                    elif kind == "start":
+                        state.partial[(record["source"], record.get("name"))] = record["output"]
+                    elif kind == "done":
+                        state.done.add((record["source"], record.get("name")))
+                        state.partial.pop((record["source"], record.get("name")), None)
+                except (ValueError, KeyError, TypeError, IndexError):
+                    continue # A torn last line from the interruption
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"Warning: could not read batch journal {path}: {e}")
+        return None
+    if plan is None:
+        return None
+    return plan, state
+
+
+class BatchJournal:
+    """Writer side. Opened with a plan it starts a new journal; opened
+    without one it appends to the interrupted journal being resumed."""
+
+    def __init__(self, path, plan=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if plan is not None:
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._write(plan_to_json(plan))
+            self._sync()
+        else:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._last_sync = time.monotonic()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def _maybe_sync(self):
+        if time.monotonic() - self._last_sync >= SYNC_INTERVAL:
+            self._sync()
+
+    def started(self, source, output_path, name=None):
+        record = {"type": "start", "source": source, "output": str(output_path)}
+        if name is not None:
+            record["name"] = name
+        self._write(record)
+        self._maybe_sync()
+
+    def finished(self, source, ok, name=None):
+        record = {"type": "done", "source": source, "ok": ok}
+        if name is not None:
+            record["name"] = name
+        self._write(record)
+        self._maybe_sync()
+
+    def close(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def complete(self):
+        # The batch ran to the end; there is nothing left to resume
+        self.close()
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
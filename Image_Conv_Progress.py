@@ -0,0 +1,142 @@
+"""Progress reporting for a running batch.
+
+The batch thread posts events to a ProgressChannel as sources are found and
+files finish; the GUI drains it on a timer (about 25 times a second) and
+redraws once per drain, however many files finished in between. Progress is
+weighted by source bytes, so one huge TIFF moves the bar as much as the
+thousands of icons it takes to add up to the same size.
+Nothing in here touches Tk.
+"""
+import queue
+import time
+
+RATE_WINDOW = 5.0 # Seconds of history behind the files/s and MB/s figures
+
+# Event kinds posted to the channel
+_SOURCES = 0
+_DONE = 1
+_SCAN_DONE = 2
+
+
+class ProgressSnapshot:
+    __slots__ = ("files_done", "files_total", "failed", "bytes_done", "bytes_total", "scanning",
+                 "fraction", "files_per_sec", "bytes_per_sec", "eta", "last_name")
+
+    def format_status(self):
+        total = f"{self.files_total:,}+" if self.scanning else f"{self.files_total:,}"
+        parts = [f"{self.files_done:,} of {total} files"]
+        if self.failed:
+            parts.append(f"{self.failed:,} failed")
+        parts.append(f"{self.files_per_sec:.1f} files/s")
+        parts.append(f"{self.bytes_per_sec / 1024 ** 2:.1f} MB/s")
+        if self.eta is not None:
+            minutes, seconds = divmod(int(self.eta + 0.5), 60)
+            hours, minutes = divmod(minutes, 60)
+            parts.append(f"ETA {hours}:{minutes:02d}:{seconds:02d}" if hours else f"ETA {minutes}:{seconds:02d}")
+        return " | ".join(parts)
+
+
+class ProgressChannel:
+    """Thread-safe progress feed: any thread posts, one thread drains.
+
+    Source sizes may be unknown when a source is announced (a folder walk only
+    yields paths); those are estimated from the average size of the rest until
+    the file finishes and its real size is counted.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._events = queue.SimpleQueue()
+        self._clock = clock
+        self._start = clock()
+        self._history = [(self._start, 0, 0)] # (time, files done, bytes done)
+        self.files_total = 0
+        self.files_done = 0
+        self.failed = 0
+        self.bytes_done = 0
+        self.scanning = False
+        self.last_name = ""
+        self._known_bytes = 0 # Announced sizes, of sources not yet finished
+        self._known_files = 0
+        self._unsized_files = 0 # Announced without a size, not yet finished
+
+    # Producer side, safe from any thread
+
+    def add_sources(self, count, known_bytes=0, unsized=0, scanning=False):
+        """Announce `count` more sources, `unsized` of them without a known size."""
+        self._events.put((_SOURCES, count, known_bytes, unsized, scanning))
+
+    def scan_finished(self):
+        self._events.put((_SCAN_DONE,))
+
+    def file_done(self, name, nbytes, failed=False, announced_size=None):
+        """Record one finished source. `nbytes` is its actual size (None if it
+        couldn't be read); `announced_size` is what add_sources was told, or
+        None if it was announced unsized."""
+        self._events.put((_DONE, name, nbytes, failed, announced_size))
+
+    # Consumer side
+
+    def drain(self):
+        """Apply everything posted so far and return a ProgressSnapshot."""
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == _DONE:
+                _, name, nbytes, failed, announced_size = event
+                self.files_done += 1
+                self.failed += bool(failed)
+                self.bytes_done += nbytes or 0
+                self.last_name = name
+                if announced_size is None:
+                    self._unsized_files = max(self._unsized_files - 1, 0)
+                else:
+                    self._known_bytes -= announced_size
+                    self._known_files -= 1
+            elif kind == _SOURCES:
+                _, count, known_bytes, unsized, scanning = event
+                self.files_total += count
+                self._known_bytes += known_bytes
+                self._known_files += count - unsized
+                self._unsized_files += unsized
+                self.scanning = self.scanning or scanning
+            else:
+                self.scanning = False
+        return self._snapshot()
+
+    def _snapshot(self):
+        now = self._clock()
+        history = self._history
+        history.append((now, self.files_done, self.bytes_done))
+        while len(history) > 2 and history[1][0] < now - RATE_WINDOW:
+            history.pop(0)
+        then, files_then, bytes_then = history[0]
+        elapsed = now - then
+
+        snap = ProgressSnapshot()
+        snap.files_done = self.files_done
+        snap.files_total = max(self.files_total, self.files_done)
+        snap.failed = self.failed
+        snap.scanning = self.scanning
+        snap.last_name = self.last_name
+        snap.files_per_sec = (self.files_done - files_then) / elapsed if elapsed > 0 else 0.0
+        snap.bytes_per_sec = (self.bytes_done - bytes_then) / elapsed if elapsed > 0 else 0.0
+
+        # Unfinished sources of unknown size are assumed to be average sized
+        if self._known_files > 0:
+            average = self._known_bytes / self._known_files
+        elif self.files_done:
+            average = self.bytes_done / self.files_done
+        else:
+            average = 0
+        bytes_left = max(self._known_bytes + self._unsized_files * average, 0)
+        snap.bytes_done = self.bytes_done
+        snap.bytes_total = self.bytes_done + bytes_left
+        if snap.bytes_total > 0:
+            snap.fraction = self.bytes_done / snap.bytes_total
+        else:
+            snap.fraction = self.files_done / snap.files_total if snap.files_total else 0.0
+        snap.eta = bytes_left / snap.bytes_per_sec if snap.bytes_per_sec > 0 and not self.scanning else None
+        return snap
@@ -1,15 +1,26 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
-from PIL import Image, ImageTk # Ensure ImageTk is imported if you plan to use it, though not used in current snippet
 import threading
+import multiprocessing
+import itertools
+from collections import OrderedDict
 from pathlib import Path
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-    HEIC_SUPPORT = True
-except ImportError:
-    HEIC_SUPPORT = False
+from Image_Conv_Engine import (HEIC_SUPPORT, OUTPUT_FORMATS, QUALITY_FORMATS, ICO_SIZES,
+                               DEFAULT_PROFILE, RESAMPLE_FILTERS, RESAMPLE_PROFILES,
+                               DEFAULT_DURABILITY, DURABILITY_MODES, DEFAULT_EFFORT, EFFORT_FORMATS, EFFORT_PRESETS,
+                               DEFAULT_PASSTHROUGH, PASSTHROUGH_MODES,
+                               ConversionSettings, default_memory_budget, iter_image_files, parse_ico_sizes)
+from Image_Conv_Dedup import DEDUP_MODES
+from Image_Conv_Batch import BatchRunner, ConversionPlan, describe_passed_through
+from Image_Conv_Progress import ProgressChannel
+from Image_Conv_Journal import BatchJournal, load_journal, default_journal_path
+from Image_Conv_FileList import (FileListModel, MetadataLoader, diff_rows,
+                                 SIZE_MISSING, SIZE_ERROR, SIZE_LOADING)
+
+TREE_INSERT_BATCH = 1000 # Rows inserted per event-loop tick, so huge lists never freeze the window
+METADATA_POLL_MS = 150 # How often finished metadata reads are applied to the file list, in one batch
+PROGRESS_POLL_MS = 40 # Progress bar and status redraw interval while converting (25 per second)
 
 class ImageConverter:
     def __init__(self, root):
@@ -18,13 +29,49 @@ class ImageConverter:
         self.root.geometry("635x700") # Consider making this more dynamic or larger if needed
         self.root.configure(bg='#f0f0f0')
         
-        self.selected_files = []
+        self.selected_files = FileListModel()
+        self.source_folders = FileListModel() # Folders whose whole tree is converted, enumerated during conversion
+        self.shown_rows = {} # iid -> (text, values) the file tree shows, or will once pending rows are inserted
+        self.pending_rows = OrderedDict() # Rows waiting for a batched insert into the file tree
+        self.insert_job = None
+        self.metadata_loader = MetadataLoader()
+        self.metadata_job = None
         self.output_dir = ""
         self.individual_quality_settings = {}
+        self.individual_effort_settings = {}
         self.is_converting = False
+        self.cancel_event = threading.Event()
+        self.progress_channel = None
+        self.progress_job = None
+        self.last_timings = None # TimingReport of the last batch, for Export Timings
         
         self.setup_ui()
-        
+        self.root.after(0, self.offer_resume)
+        
+    def offer_resume(self):
+        # A journal left behind means the last batch was cancelled or the app
+        # (or machine) went down mid-batch
+        journal_path = default_journal_path()
+        loaded = load_journal(journal_path)
+        if loaded is None:
+            return
+        plan, resume = loaded
+        total = len(plan.files)
+        description = f"{total} files" if not plan.folders else f"{total} files and {len(plan.folders)} folders"
+        if messagebox.askyesno("Resume Conversion",
+                               f"A previous conversion of {description} was interrupted after "
+                               f"{resume.finished_sources()} files.\n\nResume it now?"):
+            self.selected_files.add_many(path for path, _ in plan.files)
+            self.source_folders.add_many(path for path, _ in plan.folders)
+            self.update_file_list()
+            self.update_files_label()
+            self.run_plan(plan, resume)
+        else:
+            try:
+                journal_path.unlink()
+            except OSError:
+                pass
+    
     def setup_ui(self):
         # Main frame with scrolling capability
         main_canvas = tk.Canvas(self.root, bg='#f0f0f0', highlightthickness=0) # Added highlightthickness=0
@@ -58,16 +105,19 @@ class ImageConverter:
         # File selection section
         file_frame = ttk.LabelFrame(main_frame, text="Select Images", padding="10")
         file_frame.grid(row=1, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
-        file_frame.columnconfigure(1, weight=1)
+        file_frame.columnconfigure(2, weight=1)
         
         ttk.Button(file_frame, text="Browse Files", 
                   command=self.browse_files).grid(row=0, column=0, padx=(0, 10))
         
+        ttk.Button(file_frame, text="Add Folder (recursive)", 
+                  command=self.browse_folder).grid(row=0, column=1, padx=(0, 10))
+        
         self.files_label = ttk.Label(file_frame, text="No files selected")
-        self.files_label.grid(row=0, column=1, sticky=(tk.W, tk.E))
+        self.files_label.grid(row=0, column=2, sticky=(tk.W, tk.E))
         
         ttk.Button(file_frame, text="Clear", 
-                  command=self.clear_files).grid(row=0, column=2)
+                  command=self.clear_files).grid(row=0, column=3)
         
         # Output directory section
         output_frame = ttk.LabelFrame(main_frame, text="Output Directory", padding="10")
@@ -105,13 +155,8 @@ class ImageConverter:
         ttk.Label(self.single_format_frame, text="Convert to:").grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
         
         self.format_var = tk.StringVar(value="JPEG")
-        # --- MODIFIED: Added ICO ---
-        format_values = ["JPEG", "PNG", "WEBP", "BMP", "TIFF", "GIF", "ICO"]
-        if HEIC_SUPPORT:
-            format_values.append("HEIC")
-        
         self.format_combo = ttk.Combobox(self.single_format_frame, textvariable=self.format_var,
-                                        values=format_values, state="readonly", width=10)
+                                        values=OUTPUT_FORMATS, state="readonly", width=10)
         self.format_combo.grid(row=0, column=1, sticky=tk.W, padx=(0, 20))
         self.format_combo.bind("<<ComboboxSelected>>", self.on_format_change)
         
@@ -124,6 +169,15 @@ class ImageConverter:
                                        textvariable=self.quality_var, width=5)
         self.quality_spin.grid(row=0, column=3, sticky=tk.W, padx=(0, 20))
         
+        # Encoder effort (for JPEG/PNG/WEBP): fast encodes quickest, max gives the smallest files
+        self.effort_label = ttk.Label(self.single_format_frame, text="Effort:")
+        self.effort_label.grid(row=0, column=4, sticky=tk.W, padx=(0, 10))
+        
+        self.effort_var = tk.StringVar(value=DEFAULT_EFFORT)
+        self.effort_combo = ttk.Combobox(self.single_format_frame, textvariable=self.effort_var,
+                                         values=list(EFFORT_PRESETS), state="readonly", width=9)
+        self.effort_combo.grid(row=0, column=5, sticky=tk.W)
+        
         # Size settings
         size_frame = ttk.LabelFrame(settings_frame, text="Size Settings", padding="5")
         size_frame.grid(row=2, column=0, columnspan=5, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -160,6 +214,89 @@ class ImageConverter:
         self.ratio_check = ttk.Checkbutton(self.custom_size_frame, text="Maintain aspect ratio", 
                                           variable=self.maintain_ratio_var)
         
+        # Resampling filter, or a named speed/quality profile that also sets the reduce gap
+        resample_frame = ttk.Frame(size_frame)
+        resample_frame.grid(row=2, column=0, columnspan=3, sticky=tk.W, pady=(10, 0))
+        
+        ttk.Label(resample_frame, text="Profile:").grid(row=0, column=0, sticky=tk.W, padx=(0, 5))
+        self.profile_var = tk.StringVar(value=DEFAULT_PROFILE)
+        profile_combo = ttk.Combobox(resample_frame, textvariable=self.profile_var,
+                                     values=list(RESAMPLE_PROFILES) + ["custom"], state="readonly", width=9)
+        profile_combo.grid(row=0, column=1, sticky=tk.W, padx=(0, 20))
+        profile_combo.bind("<<ComboboxSelected>>", self.on_profile_change)
+        
+        ttk.Label(resample_frame, text="Filter:").grid(row=0, column=2, sticky=tk.W, padx=(0, 5))
+        self.resample_var = tk.StringVar(value=RESAMPLE_PROFILES[DEFAULT_PROFILE][0])
+        ttk.Combobox(resample_frame, textvariable=self.resample_var, values=RESAMPLE_FILTERS,
+                    state="readonly", width=9).grid(row=0, column=3, sticky=tk.W)
+        
+        # Parallel processing
+        workers_frame = ttk.Frame(settings_frame)
+        workers_frame.grid(row=3, column=0, columnspan=5, sticky=tk.W)
+        
+        ttk.Label(workers_frame, text="Worker processes:").grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
+        
+        self.workers_var = tk.StringVar(value=str(os.cpu_count() or 1))
+        self.workers_spin = ttk.Spinbox(workers_frame, from_=1, to=max(64, os.cpu_count() or 1),
+                                       textvariable=self.workers_var, width=5)
+        self.workers_spin.grid(row=0, column=1, sticky=tk.W, padx=(0, 20))
+        
+        self.use_draft_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(workers_frame, text="Fast JPEG downscale (draft decode)",
+                       variable=self.use_draft_var).grid(row=0, column=2, sticky=tk.W)
+        
+        # Integer pre-reduction before the final filter; "Off" resamples from full size
+        ttk.Label(workers_frame, text="Reduce gap:").grid(row=1, column=0, sticky=tk.W, padx=(0, 10), pady=(5, 0))
+        self.reducing_gap_var = tk.StringVar(value=str(RESAMPLE_PROFILES[DEFAULT_PROFILE][1]))
+        ttk.Combobox(workers_frame, textvariable=self.reducing_gap_var,
+                    values=["Off", "1.5", "2.0", "3.0", "4.0"], width=5).grid(row=1, column=1, sticky=tk.W, pady=(5, 0))
+        self.resample_var.trace_add('write', self.sync_profile)
+        self.reducing_gap_var.trace_add('write', self.sync_profile)
+        
+        self.skip_unchanged_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(workers_frame, text="Skip files already converted with these settings",
+                       variable=self.skip_unchanged_var).grid(row=1, column=2, sticky=tk.W, pady=(5, 0))
+        
+        # Byte-identical sources: convert once, then hardlink or copy the output
+        ttk.Label(workers_frame, text="Identical files:").grid(row=2, column=0, sticky=tk.W, padx=(0, 10), pady=(5, 0))
+        self.dedup_mode_var = tk.StringVar(value="off")
+        ttk.Combobox(workers_frame, textvariable=self.dedup_mode_var, values=DEDUP_MODES,
+                    state="readonly", width=9).grid(row=2, column=1, sticky=tk.W, pady=(5, 0))
+        
+        # Frames written into ICO files; sizes larger than the image are skipped
+        ico_frame = ttk.Frame(workers_frame)
+        ico_frame.grid(row=2, column=2, sticky=tk.W, pady=(5, 0))
+        ttk.Label(ico_frame, text="Icon sizes:").grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
+        self.ico_sizes_var = tk.StringVar(value=",".join(str(size) for size in sorted(ICO_SIZES)))
+        ttk.Entry(ico_frame, textvariable=self.ico_sizes_var, width=22).grid(row=0, column=1, sticky=tk.W)
+        
+        # Conversions only start while their estimated image memory fits; 0 means no limit
+        ttk.Label(workers_frame, text="Memory budget (MB):").grid(row=3, column=0, sticky=tk.W, padx=(0, 10), pady=(5, 0))
+        default_budget = default_memory_budget()
+        self.memory_budget_var = tk.StringVar(value=str(default_budget // 1024 ** 2 if default_budget else 0))
+        ttk.Entry(workers_frame, textvariable=self.memory_budget_var, width=8).grid(row=3, column=1, sticky=tk.W, pady=(5, 0))
+        
+        # When outputs are fsync'ed: never, per file, or all at the end of the batch
+        durability_frame = ttk.Frame(workers_frame)
+        durability_frame.grid(row=3, column=2, sticky=tk.W, pady=(5, 0))
+        ttk.Label(durability_frame, text="Flush to disk:").grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
+        self.durability_var = tk.StringVar(value=DEFAULT_DURABILITY)
+        ttk.Combobox(durability_frame, textvariable=self.durability_var, values=DURABILITY_MODES,
+                    state="readonly", width=7).grid(row=0, column=1, sticky=tk.W)
+        
+        # JPEG/WEBP/HEIC outputs get the highest quality (up to the one set) that fits; 0 means off
+        ttk.Label(workers_frame, text="Max file size (KB):").grid(row=4, column=0, sticky=tk.W, padx=(0, 10), pady=(5, 0))
+        self.max_size_var = tk.StringVar(value="0")
+        ttk.Entry(workers_frame, textvariable=self.max_size_var, width=8).grid(row=4, column=1, sticky=tk.W, pady=(5, 0))
+        
+        # Sources already in the target format, size and mode are copied or hardlinked, not re-encoded
+        passthrough_frame = ttk.Frame(workers_frame)
+        passthrough_frame.grid(row=4, column=2, sticky=tk.W, pady=(5, 0))
+        ttk.Label(passthrough_frame, text="Files needing no conversion:").grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
+        self.passthrough_var = tk.StringVar(value=DEFAULT_PASSTHROUGH)
+        ttk.Combobox(passthrough_frame, textvariable=self.passthrough_var, values=PASSTHROUGH_MODES,
+                    state="readonly", width=9).grid(row=0, column=1, sticky=tk.W)
+        
         # File list with format selection
         list_frame = ttk.LabelFrame(main_frame, text="Selected Files", padding="10")
         list_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
@@ -172,15 +309,17 @@ class ImageConverter:
         tree_frame.columnconfigure(0, weight=1)
         tree_frame.rowconfigure(0, weight=1) 
         
-        self.file_tree = ttk.Treeview(tree_frame, columns=("size", "format", "target_format"), show="tree headings", height=5) # Set desired number of rows
+        self.file_tree = ttk.Treeview(tree_frame, columns=("size", "format", "dimensions", "target_format"), show="tree headings", height=5) # Set desired number of rows
         self.file_tree.heading("#0", text="File Name")
         self.file_tree.heading("size", text="Size")
         self.file_tree.heading("format", text="Current Format")
+        self.file_tree.heading("dimensions", text="Dimensions")
         self.file_tree.heading("target_format", text="Convert To")
         
         self.file_tree.column("#0", width=280, stretch=tk.YES) # Allow name column to stretch
         self.file_tree.column("size", width=100, stretch=tk.NO)
         self.file_tree.column("format", width=80, stretch=tk.NO)
+        self.file_tree.column("dimensions", width=90, stretch=tk.NO)
         self.file_tree.column("target_format", width=100, stretch=tk.NO)
         
         self.file_tree.bind("<Double-1>", self.on_item_double_click)
@@ -217,6 +356,11 @@ class ImageConverter:
         self.status_label = ttk.Label(progress_frame, text="Ready")
         self.status_label.grid(row=1, column=0, sticky=tk.W)
         
+        # Per-file stage timings of the last batch, as CSV or JSON
+        self.export_timings_btn = ttk.Button(progress_frame, text="Export Timings...",
+                                             command=self.export_timings, state="disabled")
+        self.export_timings_btn.grid(row=1, column=1, sticky=tk.E)
+        
         # Convert button
         self.convert_btn = ttk.Button(main_frame, text="Convert Images", 
                                      command=self.start_conversion)
@@ -246,19 +390,21 @@ class ImageConverter:
         else:
             self.quality_label.grid_remove()
             self.quality_spin.grid_remove()
+        if format_name in EFFORT_FORMATS:
+            self.effort_label.grid()
+            self.effort_combo.grid()
+        else:
+            self.effort_label.grid_remove()
+            self.effort_combo.grid_remove()
         
     def toggle_conversion_mode(self):
         if self.conversion_mode.get() == "all_to_one":
             self.single_format_frame.grid()
             self.individual_controls_frame.grid_remove()
-            # Update target format column for all items if switching to "all_to_one"
-            if self.file_tree.get_children():
-                new_target_format = self.format_var.get()
-                for item_id in self.file_tree.get_children():
-                    values = list(self.file_tree.item(item_id, "values"))
-                    if len(values) >= 3:
-                        values[2] = new_target_format
-                        self.file_tree.item(item_id, values=values)
+            # Update target format for all items if switching to "all_to_one"
+            new_target_format = self.format_var.get()
+            for entry in itertools.chain(self.selected_files.entries(), self.source_folders.entries()):
+                entry.target_format = new_target_format
 
         else: # "individual" mode
             self.single_format_frame.grid_remove()
@@ -268,6 +414,26 @@ class ImageConverter:
             # For now, let's keep them, user can double click to change
         self.update_file_list() # Refresh list to reflect mode changes
     
+    def on_profile_change(self, event=None):
+        profile = self.profile_var.get()
+        if profile not in RESAMPLE_PROFILES:
+            return # "custom": leave the filter and gap as they are
+        resample, reducing_gap = RESAMPLE_PROFILES[profile]
+        self.resample_var.set(resample)
+        self.reducing_gap_var.set("Off" if reducing_gap is None else str(reducing_gap))
+    
+    def sync_profile(self, *args):
+        # Show which profile the current filter and gap amount to, or "custom"
+        try:
+            current = (self.resample_var.get(), self.get_reducing_gap())
+        except ValueError:
+            current = None
+        for profile, settings in RESAMPLE_PROFILES.items():
+            if settings == current:
+                self.profile_var.set(profile)
+                return
+        self.profile_var.set("custom")
+    
     def toggle_size_mode(self):
         for widget in [self.width_label, self.width_entry, self.height_label, 
                       self.height_entry, self.percentage_label, self.percentage_entry, 
@@ -300,26 +466,24 @@ class ImageConverter:
     def show_format_dialog(self, item):
         dialog = tk.Toplevel(self.root)
         dialog.title("Select Target Format")
-        dialog.geometry("300x250") # Adjusted for potential quality spinbox
+        dialog.geometry("300x310") # Adjusted for potential quality spinbox and effort combobox
         dialog.transient(self.root)
         dialog.grab_set()
         
         dialog.geometry("+%d+%d" % (self.root.winfo_rootx() + 50, self.root.winfo_rooty() + 50))
         
-        current_values = self.file_tree.item(item, "values")
-        current_target = current_values[2] if len(current_values) > 2 and current_values[2] else "JPEG"
+        entry = self.selected_files.get(item) or self.source_folders.get(item)
+        if entry is None:
+            dialog.destroy()
+            return
+        current_target = entry.target_format or "JPEG"
         
-        ttk.Label(dialog, text=f"File: {self.file_tree.item(item, 'text')}").pack(pady=(10,0))
+        ttk.Label(dialog, text=f"File: {entry.name}").pack(pady=(10,0))
         ttk.Label(dialog, text="Convert to format:").pack(pady=(5,0))
         format_var = tk.StringVar(value=current_target)
         
-        # --- MODIFIED: Added ICO ---
-        format_values = ["JPEG", "PNG", "WEBP", "BMP", "TIFF", "GIF", "ICO"]
-        if HEIC_SUPPORT:
-            format_values.append("HEIC")
-            
         format_combo = ttk.Combobox(dialog, textvariable=format_var,
-                                   values=format_values, state="readonly")
+                                   values=OUTPUT_FORMATS, state="readonly")
         format_combo.pack(pady=5)
         
         quality_frame = ttk.Frame(dialog)
@@ -346,23 +510,41 @@ class ImageConverter:
         format_var.trace_add('write', update_quality_visibility) # Use trace_add for modern Tk
         update_quality_visibility() # Initial call
         
+        effort_frame = ttk.Frame(dialog)
+        effort_frame.pack()
+        
+        effort_label = ttk.Label(effort_frame, text="Encoder effort (for JPEG/PNG/WEBP):")
+        effort_var = tk.StringVar(value=self.individual_effort_settings.get(item, DEFAULT_EFFORT))
+        effort_combo = ttk.Combobox(effort_frame, textvariable=effort_var, values=list(EFFORT_PRESETS),
+                                    state="readonly", width=10)
+        
+        def update_effort_visibility(*args):
+            if format_var.get() in EFFORT_FORMATS:
+                effort_label.pack(pady=(5,0))
+                effort_combo.pack(pady=5)
+            else:
+                effort_label.pack_forget()
+                effort_combo.pack_forget()
+        
+        format_var.trace_add('write', update_effort_visibility)
+        update_effort_visibility()
+        
         button_frame = ttk.Frame(dialog)
         button_frame.pack(pady=20)
         
         def apply_format():
             new_format = format_var.get()
-            values = list(self.file_tree.item(item, "values"))
-            if len(values) >= 3:
-                values[2] = new_format
-            else: # Should not happen if list is populated correctly
-                values.extend([""] * (3 - len(values))) # Pad if necessary
-                values[2] = new_format
-            self.file_tree.item(item, values=values)
+            entry.target_format = new_format
+            self.refresh_row(entry)
             
             if new_format in ["JPEG", "WEBP", "HEIC"]:
                 self.individual_quality_settings[item] = quality_var.get()
             elif item in self.individual_quality_settings: # Remove quality if not applicable
                 del self.individual_quality_settings[item]
+            if new_format in EFFORT_FORMATS:
+                self.individual_effort_settings[item] = effort_var.get()
+            else:
+                self.individual_effort_settings.pop(item, None)
             
             dialog.destroy()
         
@@ -392,10 +574,9 @@ class ImageConverter:
         
         if files:
             # Add new files, avoid duplicates if browsing multiple times
-            new_files = [f for f in files if f not in self.selected_files]
-            self.selected_files.extend(new_files)
+            new_files = self.selected_files.add_many(files)
             self.update_file_list()
-            self.files_label.config(text=f"{len(self.selected_files)} files selected")
+            self.update_files_label()
             
             if not HEIC_SUPPORT and any(f.lower().endswith(('.heic', '.heif')) for f in new_files):
                 messagebox.showwarning("HEIC Support", 
@@ -403,9 +584,27 @@ class ImageConverter:
                     "Install it with: pip install pillow-heif\n" +
                     "HEIC files will be skipped during conversion.")
     
+    def browse_folder(self):
+        directory = filedialog.askdirectory(title="Select Folder (all images in it and its subfolders)")
+        if directory and self.source_folders.add(directory):
+            # The tree is only walked when converting, so huge folders add instantly
+            self.update_file_list()
+            self.update_files_label()
+    
+    def update_files_label(self):
+        parts = []
+        if self.selected_files:
+            parts.append(f"{len(self.selected_files)} files")
+        if self.source_folders:
+            parts.append(f"{len(self.source_folders)} folders")
+        self.files_label.config(text=(", ".join(parts) + " selected") if parts else "No files selected")
+    
     def clear_files(self):
-        self.selected_files = []
+        self.selected_files.clear()
+        self.source_folders.clear()
+        self.metadata_loader.cancel()
         self.individual_quality_settings = {}
+        self.individual_effort_settings = {}
         self.update_file_list()
         self.files_label.config(text="No files selected")
     
@@ -415,72 +614,107 @@ class ImageConverter:
             self.output_dir = directory
             self.output_label.config(text=directory)
     
+    def build_row(self, entry, is_folder, global_target):
+        # (text, values) for one tree row. global_target is the all_to_one
+        # format, or None in individual mode; it is read once per refresh by
+        # the caller rather than once per row.
+        target_format_val = global_target or entry.target_format or "JPEG" # Default for new items
+        
+        if is_folder:
+            return f"{entry.name} (folder)", ("Folder", "Recursive", "", target_format_val)
+        if entry.size == SIZE_MISSING:
+            return entry.name, ("File not found", "Unknown", "", target_format_val)
+        if entry.size == SIZE_ERROR:
+            return entry.name, ("Error", "Unknown", "", target_format_val)
+        if entry.size is None or entry.size == SIZE_LOADING:
+            # Until the background read lands, guess the format from the extension
+            return entry.name, ("...", Path(entry.path).suffix.upper().lstrip('.'), "...", target_format_val)
+        dimensions_str = f"{entry.dimensions[0]}x{entry.dimensions[1]}" if entry.dimensions else ""
+        return entry.name, (self.format_file_size(entry.size), entry.format or "Unknown",
+                            dimensions_str, target_format_val)
+    
+    def global_target_format(self):
+        if self.conversion_mode.get() == "all_to_one":
+            return self.format_var.get()
+        return None
+    
     def update_file_list(self):
-        # Store current selection and scroll position if needed (more advanced)
-        # For now, just rebuild
+        # Rows are keyed by path (the tree iid). Only rows that were added,
+        # removed or changed are touched; new rows are inserted in batches.
+        global_target = self.global_target_format()
+        build_row = self.build_row
+        wanted_rows = {}
+        to_load = []
+        for entry in self.selected_files.entries():
+            if entry.size is None:
+                entry.size = SIZE_LOADING
+                to_load.append(entry.path)
+            wanted_rows[entry.path] = build_row(entry, False, global_target)
+        # Folder sources get one row each; its target format applies to every file found in it
+        for entry in self.source_folders.entries():
+            wanted_rows[entry.path] = build_row(entry, True, global_target)
+        
+        to_delete, to_update, to_insert = diff_rows(self.shown_rows, wanted_rows)
+        
+        in_tree = [iid for iid in to_delete if self.pending_rows.pop(iid, None) is None]
+        if in_tree:
+            self.file_tree.delete(*in_tree)
+        for iid in to_delete:
+            self.individual_quality_settings.pop(iid, None) # Clean up quality settings
+            self.individual_effort_settings.pop(iid, None)
+        
+        for iid, text, values in to_update:
+            if iid in self.pending_rows:
+                self.pending_rows[iid] = (text, values)
+            else:
+                self.file_tree.item(iid, text=text, values=values)
         
-        # Get all current item IDs from the tree
-        tree_items_map = {self.file_tree.item(item_id, "text"): item_id for item_id in self.file_tree.get_children()}
+        for iid, text, values in to_insert:
+            self.pending_rows[iid] = (text, values)
         
-        new_file_paths_set = set(self.selected_files)
-        existing_filenames_in_tree = set(tree_items_map.keys())
-
-        # Remove items from tree that are no longer in selected_files
-        for filename, item_id in list(tree_items_map.items()): # Iterate over a copy
-            file_path_found = False
-            for f_path in self.selected_files:
-                if Path(f_path).name == filename:
-                    file_path_found = True
-                    break
-            if not file_path_found:
-                if self.file_tree.exists(item_id):
-                    self.file_tree.delete(item_id)
-                if item_id in self.individual_quality_settings:
-                    del self.individual_quality_settings[item_id] # Clean up quality settings
-
-        # Add new files or update existing ones
-        for file_path in self.selected_files:
-            path_obj = Path(file_path)
-            filename = path_obj.name
-            
-            try:
-                target_format_val = "JPEG" # Default for new items
-                if self.conversion_mode.get() == "all_to_one":
-                    target_format_val = self.format_var.get()
-                
-                item_id = tree_items_map.get(filename)
-
-                if path_obj.exists():
-                    size = path_obj.stat().st_size
-                    size_str = self.format_file_size(size)
-                    format_str = path_obj.suffix.upper().lstrip('.')
-                    
-                    # If in individual mode and item exists, try to keep its target format
-                    if item_id and self.conversion_mode.get() == "individual":
-                        current_item_values = self.file_tree.item(item_id, "values")
-                        if len(current_item_values) >= 3 and current_item_values[2]:
-                            target_format_val = current_item_values[2]
-                    
-                    values_tuple = (size_str, format_str, target_format_val)
-
-                    if item_id and self.file_tree.exists(item_id): # File is already in tree, update it
-                        self.file_tree.item(item_id, values=values_tuple)
-                    else: # New file, insert it
-                        self.file_tree.insert("", "end", iid=file_path, text=filename, # Use file_path as iid for uniqueness
-                                             values=values_tuple)
-                else: # File not found
-                    if item_id and self.file_tree.exists(item_id):
-                        self.file_tree.item(item_id, values=("File not found", "Unknown", target_format_val))
-                    else:
-                        self.file_tree.insert("", "end", iid=file_path, text=filename,
-                                             values=("File not found", "Unknown", target_format_val))
-            except Exception as e:
-                print(f"Error updating file list for {filename}: {e}")
-                if item_id and self.file_tree.exists(item_id):
-                     self.file_tree.item(item_id, values=("Error", "Unknown", target_format_val))
-                else:
-                    self.file_tree.insert("", "end", iid=file_path, text=filename,
-                                         values=("Error", "Unknown", target_format_val))
+        self.shown_rows = wanted_rows
+        if self.pending_rows and self.insert_job is None:
+            self.insert_job = self.root.after(0, self.insert_pending_rows)
+        
+        # stat() and header reads happen off the Tk thread (they can take
+        # seconds on network shares); the rows fill in as results arrive
+        if to_load:
+            self.metadata_loader.request(to_load)
+            if self.metadata_job is None:
+                self.metadata_job = self.root.after(METADATA_POLL_MS, self.apply_metadata_updates)
+    
+    def apply_metadata_updates(self):
+        self.metadata_job = None
+        global_target = self.global_target_format()
+        for path, (size, format_name, dimensions) in self.metadata_loader.drain(TREE_INSERT_BATCH * 5):
+            entry = self.selected_files.get(path)
+            if entry is None: # Removed from the list while loading
+                continue
+            entry.size, entry.format, entry.dimensions = size, format_name, dimensions
+            self.refresh_row(entry, global_target)
+        if self.metadata_loader.outstanding > 0:
+            self.metadata_job = self.root.after(METADATA_POLL_MS, self.apply_metadata_updates)
+    
+    def insert_pending_rows(self):
+        self.insert_job = None
+        insert = self.file_tree.insert
+        for _ in range(min(TREE_INSERT_BATCH, len(self.pending_rows))):
+            iid, (text, values) = self.pending_rows.popitem(last=False)
+            insert("", "end", iid=iid, text=text, values=values)
+        if self.pending_rows:
+            # Give the event loop a turn before the next batch
+            self.insert_job = self.root.after(1, self.insert_pending_rows)
+    
+    def refresh_row(self, entry, global_target=None):
+        is_folder = entry.path in self.source_folders
+        row = self.build_row(entry, is_folder, global_target or self.global_target_format())
+        if self.shown_rows.get(entry.path) == row:
+            return
+        self.shown_rows[entry.path] = row
+        if entry.path in self.pending_rows:
+            self.pending_rows[entry.path] = row
+        else:
+            self.file_tree.item(entry.path, text=row[0], values=row[1])
     
     def format_file_size(self, size_bytes):
         if size_bytes < 1024:
@@ -493,7 +727,7 @@ class ImageConverter:
             return f"{size_bytes/(1024**3):.1f} GB"
     
     def validate_inputs(self):
-        if not self.selected_files:
+        if not self.selected_files and not self.source_folders:
             messagebox.showwarning("No Files", "Please select image files to convert.")
             return False
         
@@ -530,8 +764,63 @@ class ImageConverter:
         # For individual mode, quality is validated when set in the dialog implicitly by Spinbox.
         # Or, could add validation here by iterating through self.individual_quality_settings
         
+        try:
+            parse_ico_sizes(self.ico_sizes_var.get())
+        except ValueError:
+            messagebox.showerror("Invalid Input", "Please enter icon sizes as comma-separated numbers from 1 to 256.")
+            return False
+        
+        try:
+            workers = int(self.workers_var.get())
+            if workers <= 0:
+                raise ValueError("Worker count must be positive")
+        except ValueError:
+            messagebox.showerror("Invalid Input", "Please enter a valid positive number of worker processes.")
+            return False
+        
+        try:
+            self.get_reducing_gap()
+        except ValueError:
+            messagebox.showerror("Invalid Input", "Reduce gap must be 'Off' or a number greater than 1.")
+            return False
+        
+        try:
+            self.get_memory_budget()
+        except ValueError:
+            messagebox.showerror("Invalid Input", "Memory budget must be a number of megabytes (0 for no limit).")
+            return False
+        
+        try:
+            self.get_max_bytes()
+        except ValueError:
+            messagebox.showerror("Invalid Input", "Max file size must be a number of kilobytes (0 for no limit).")
+            return False
+        
         return True
     
+    def get_reducing_gap(self):
+        value = self.reducing_gap_var.get().strip()
+        if value.lower() in ("", "off", "none"):
+            return None
+        gap = float(value)
+        if gap <= 1.0:
+            raise ValueError("Reduce gap must be greater than 1")
+        return gap
+    
+    def get_memory_budget(self):
+        # Bytes, or None for no limit
+        megabytes = float(self.memory_budget_var.get())
+        if megabytes < 0:
+            raise ValueError("Memory budget must not be negative")
+        return int(megabytes * 1024 ** 2) or None
+    
+    def get_max_bytes(self):
+        # Size limit for JPEG/WEBP/HEIC outputs in bytes, or None for fixed quality
+        kilobytes = float(self.max_size_var.get())
+        if kilobytes < 0:
+            raise ValueError("Max file size must not be negative")
+        return int(kilobytes * 1024) or None
+    
     def start_conversion(self):
         if not self.validate_inputs():
             return
@@ -540,158 +829,129 @@ class ImageConverter:
             messagebox.showinfo("Conversion in Progress", "A conversion is already in progress.")
             return
         
+        self.run_plan(self.build_conversion_plan())
+    
+    def run_plan(self, plan, resume=None):
         self.convert_btn.config(state="disabled")
         self.is_converting = True
+        self.cancel_event.clear()
+        
+        self.progress_channel = ProgressChannel()
+        self.progress_channel.add_sources(len(plan.files), sum(plan.source_sizes.values()),
+                                          unsized=len(plan.files) - len(plan.source_sizes))
+        self.progress_job = self.root.after(PROGRESS_POLL_MS, self.poll_progress)
         
-        thread = threading.Thread(target=self.convert_images, daemon=True)
+        thread = threading.Thread(target=self.convert_images, args=(plan, self.progress_channel, resume), daemon=True)
         thread.start()
     
-    def convert_images(self):
+    def poll_progress(self):
+        # One redraw per tick, however many files finished since the last one
+        snapshot = self.progress_channel.drain()
+        self.progress_var.set(snapshot.fraction * 100)
+        self.status_label.config(text=snapshot.format_status())
+        self.progress_job = self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+    
+    def stop_progress_polling(self):
+        if self.progress_job is not None:
+            self.root.after_cancel(self.progress_job)
+            self.progress_job = None
+    
+    def build_conversion_plan(self):
+        # Read every setting once, here on the Tk thread. The conversion thread
+        # and the workers only see this snapshot, so they never call into Tcl
+        # and changing a widget mid-batch has no effect on the running batch.
+        all_to_one = self.conversion_mode.get() == "all_to_one"
+        global_target_format = self.format_var.get()
+        default_quality = 85
+        if all_to_one and global_target_format in QUALITY_FORMATS:
+            try:
+                default_quality = int(self.quality_var.get())
+            except ValueError:
+                default_quality = 85
+        default_effort = self.effort_var.get() if all_to_one else DEFAULT_EFFORT
+        resize_spec = dict(size_mode=self.size_mode.get(), width=self.width_var.get(),
+                           height=self.height_var.get(), percentage=self.percentage_var.get(),
+                           maintain_ratio=self.maintain_ratio_var.get(), use_draft=self.use_draft_var.get(),
+                           reducing_gap=self.get_reducing_gap(), resample=self.resample_var.get(),
+                           ico_sizes=parse_ico_sizes(self.ico_sizes_var.get()), max_bytes=self.get_max_bytes(),
+                           passthrough=self.passthrough_var.get())
+        resolved = {} # (format, quality, effort) -> ConversionSettings shared by every item using it
+        
+        def item_settings(entry):
+            # Conversion settings for a file or a folder source
+            item_target_format = global_target_format
+            item_quality = default_quality
+            item_effort = default_effort
+            if not all_to_one:
+                item_target_format = entry.target_format or "JPEG" # Default
+                if item_target_format in QUALITY_FORMATS:
+                    stored_q = self.individual_quality_settings.get(entry.path)
+                    if stored_q is not None:
+                        try:
+                            item_quality = int(stored_q)
+                        except ValueError:
+                            pass # Keep default_quality
+                item_effort = self.individual_effort_settings.get(entry.path, DEFAULT_EFFORT)
+            key = (item_target_format, item_quality, item_effort)
+            settings = resolved.get(key)
+            if settings is None:
+                settings = resolved[key] = ConversionSettings(item_target_format, item_quality,
+                                                              effort=item_effort, **resize_spec)
+            return settings
+        
+        return ConversionPlan([(entry.path, item_settings(entry)) for entry in self.selected_files.entries()],
+                              [(entry.path, item_settings(entry)) for entry in self.source_folders.entries()],
+                              self.output_dir, int(self.workers_var.get()),
+                              skip_unchanged=self.skip_unchanged_var.get(),
+                              dedup_mode=self.dedup_mode_var.get(),
+                              memory_budget=self.get_memory_budget(),
+                              durability=self.durability_var.get(),
+                              source_sizes={entry.path: entry.size for entry in self.selected_files.entries()
+                                            if entry.size is not None and entry.size >= 0})
+    
+    def convert_images(self, plan, progress, resume=None):
         try:
-            default_quality = 85
-            if self.conversion_mode.get() == "all_to_one":
-                global_target_format = self.format_var.get()
-                if global_target_format in ["JPEG", "WEBP", "HEIC"]:
-                    try:
-                        default_quality = int(self.quality_var.get())
-                    except ValueError:
-                        default_quality = 85
+            # Journal the batch so it can be resumed if it doesn't finish
+            try:
+                journal = BatchJournal(default_journal_path(), None if resume is not None else plan)
+            except OSError as e:
+                print(f"Warning: batch journal unavailable, this batch can't be resumed: {e}")
+                journal = None
             
-            total_files = len(self.selected_files)
-            successful = 0
-            failed = 0
-            failed_files_details = [] # Store tuples of (filename, error_message)
+            def iter_sources():
+                yield from plan.files
+                if not plan.folders:
+                    return
+                for folder, folder_settings in plan.folders:
+                    # Files are yielded as the walk finds them, so workers start
+                    # converting long before a big tree is fully enumerated;
+                    # an output directory inside the tree isn't walked
+                    for file_path_str in iter_image_files(folder, exclude=[plan.output_dir]):
+                        progress.add_sources(1, unsized=1, scanning=True)
+                        yield file_path_str, folder_settings
+                progress.scan_finished()
             
-            for i, file_path_str in enumerate(self.selected_files):
-                current_path = Path(file_path_str)
-                filename_for_status = current_path.name
-                
-                # Update progress
-                progress_val = ((i + 1) / total_files) * 100 # Use i+1 for 1-based progress
-                self.root.after(0, lambda p=progress_val: self.progress_var.set(p))
-                self.root.after(0, lambda name=filename_for_status: self.status_label.config(text=f"Converting: {name}"))
-
-                try:
-                    if not HEIC_SUPPORT and current_path.suffix.lower() in ['.heic', '.heif']:
-                        raise Exception("HEIC not supported (pillow-heif not installed)")
-
-                    # Determine target format and quality for this specific file
-                    item_target_format = "JPEG" # Default
-                    item_quality = default_quality
-
-                    if self.conversion_mode.get() == "individual":
-                        # Find the item in the tree by its path (used as iid)
-                        item_id = file_path_str # We used file_path as iid
-                        if self.file_tree.exists(item_id):
-                            values = self.file_tree.item(item_id, "values")
-                            if len(values) >= 3 and values[2]:
-                                item_target_format = values[2]
-                            
-                            if item_target_format in ["JPEG", "WEBP", "HEIC"]:
-                                stored_q = self.individual_quality_settings.get(item_id)
-                                if stored_q is not None:
-                                    try:
-                                        item_quality = int(stored_q)
-                                    except ValueError:
-                                        pass # Keep default_quality
-                        else: # Should not happen if list is synced
-                            print(f"Warning: File {filename_for_status} not found in tree for individual settings.")
-                    else: # all_to_one mode
-                        item_target_format = global_target_format
-                        # item_quality is already default_quality (which was set from global settings)
-
-                    with Image.open(current_path) as img:
-                        # Apply resizing
-                        resized_img = img
-                        if self.size_mode.get() == "custom_size":
-                            new_w = int(self.width_var.get())
-                            new_h = int(self.height_var.get())
-                            if self.maintain_ratio_var.get():
-                                temp_img = resized_img.copy()
-                                temp_img.thumbnail((new_w, new_h), Image.Resampling.LANCZOS)
-                                resized_img = temp_img
-                            else:
-                                resized_img = resized_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-                        elif self.size_mode.get() == "percentage":
-                            scale = float(self.percentage_var.get()) / 100.0
-                            new_w = int(resized_img.width * scale)
-                            new_h = int(resized_img.height * scale)
-                            if new_w > 0 and new_h > 0:
-                                if self.maintain_ratio_var.get(): # Percentage inherently maintains ratio if applied to both w/h
-                                    resized_img = resized_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-                                else: # This case for percentage without maintaining ratio is a bit odd, but let's implement as direct scale
-                                     resized_img = resized_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-
-
-                        # Handle mode conversion after resizing
-                        img_to_save = resized_img
-                        if item_target_format == "JPEG":
-                            if img_to_save.mode in ("RGBA", "P", "LA"):
-                                if img_to_save.mode == "P":
-                                    img_to_save = img_to_save.convert("RGBA")
-                                if img_to_save.mode == "LA":
-                                     img_to_save = img_to_save.convert("RGBA") # Simplify: LA to RGBA
-                                
-                                # Now img_to_save is RGBA if it had alpha
-                                background = Image.new("RGB", img_to_save.size, (255, 255, 255))
-                                background.paste(img_to_save, mask=img_to_save.split()[-1])
-                                img_to_save = background
-                            elif img_to_save.mode != "RGB": # Ensure it's RGB if not already handled by alpha
-                                img_to_save = img_to_save.convert("RGB")
-
-                        elif item_target_format == "PNG":
-                            if img_to_save.mode not in ("RGBA", "RGB", "P", "L", "LA"):
-                                img_to_save = img_to_save.convert("RGBA") # Prefer RGBA for PNG to keep transparency
-                        elif item_target_format == "HEIC":
-                            if img_to_save.mode not in ("RGB", "RGBA"):
-                                img_to_save = img_to_save.convert("RGB") # Default to RGB
-                        # --- MODIFIED: ICO mode conversion ---
-                        elif item_target_format == "ICO":
-                            if img_to_save.mode != "RGBA":
-                                img_to_save = img_to_save.convert("RGBA") # ICOs benefit from RGBA for transparency
-
-                        # Determine output path
-                        output_base_dir = Path(self.output_dir) if self.output_dir else current_path.parent
-                        output_base_dir.mkdir(parents=True, exist_ok=True)
-                        
-                        # --- MODIFIED: ICO extension ---
-                        file_extension = item_target_format.lower()
-                        if item_target_format == "ICO":
-                            file_extension = "ico"
-                        
-                        output_filename = f"{current_path.stem}.{file_extension}"
-                        final_output_path = output_base_dir / output_filename
-                        
-                        counter = 1
-                        while final_output_path.exists():
-                            output_filename = f"{current_path.stem}_{counter}.{file_extension}"
-                            final_output_path = output_base_dir / output_filename
-                            counter += 1
-                        
-                        save_kwargs = {}
-                        if item_target_format in ["JPEG", "WEBP", "HEIC"]:
-                            save_kwargs["quality"] = item_quality
-                            if item_target_format != "HEIC": # pillow-heif doesn't use 'optimize'
-                                save_kwargs["optimize"] = True
-                        elif item_target_format == "PNG":
-                            save_kwargs["optimize"] = True
-                        # --- MODIFIED: ICO save options ---
-                        elif item_target_format == "ICO":
-                            # Standard sizes for ICO. Pillow will resize `img_to_save` for each.
-                            save_kwargs["sizes"] = [(16,16), (32,32), (48,48), (64,64), (128,128), (256,256)]
-                            # If img_to_save is smaller than 256x256, Pillow will upscale for larger icon sizes.
-                            # If img_to_save is very large, it will be downscaled.
-                        
-                        img_to_save.save(final_output_path, format=item_target_format, **save_kwargs)
-                        successful += 1
-                        
-                except Exception as e_inner:
-                    failed += 1
-                    failed_files_details.append((filename_for_status, str(e_inner)))
-                    print(f"Error converting {current_path}: {e_inner}")
+            workers = plan.workers
+            if not plan.folders:
+                workers = min(workers, max(len(plan.files), 1))
+            runner = BatchRunner(workers, plan.output_dir,
+                                 skip_unchanged=plan.skip_unchanged,
+                                 dedup_mode=plan.dedup_mode,
+                                 cancel_event=self.cancel_event,
+                                 journal=journal, resume=resume,
+                                 memory_budget=plan.memory_budget,
+                                 durability=plan.durability)
+            
+            source_sizes = plan.source_sizes
+            
+            def on_file_done(file_path_str, error, source_size):
+                # Only posts to the channel; the Tk thread picks it up on its next poll
+                progress.file_done(Path(file_path_str).name, source_size, error is not None,
+                                   source_sizes.get(file_path_str))
             
-            self.root.after(0, lambda: self.progress_var.set(100)) # Ensure 100% at the end
-            self.root.after(0, lambda: self.conversion_complete(successful, failed, failed_files_details))
+            result = runner.run(iter_sources(), on_file_done)
+            
+            self.root.after(0, lambda: self.conversion_complete(result))
             
         except Exception as e_outer: # Should ideally not be reached if inner try-except is robust
             self.root.after(0, lambda: self.conversion_error(f"An unexpected error occurred: {str(e_outer)}"))
@@ -699,23 +959,73 @@ class ImageConverter:
             self.is_converting = False
             self.root.after(0, lambda: self.convert_btn.config(state="normal")) # Re-enable button
     
-    def conversion_complete(self, successful, failed, failed_files_details):
+    def cancel_pending_conversions(self):
+        # Files already being processed finish; queued ones are dropped
+        self.cancel_event.set()
+    
+    def conversion_complete(self, result):
+        self.stop_progress_polling()
+        self.progress_var.set(100) # Ensure 100% at the end
+        successful = result.successful
+        failed = result.failed
+        failed_files_details = result.failed_files_details
         final_status_msg = f"Conversion Complete: {successful} succeeded, {failed} failed."
+        self.last_timings = result.timings
+        self.export_timings_btn.config(state="normal" if result.timings else "disabled")
+        timing_summary = result.timings.format_summary()
+        if result.skipped:
+            final_status_msg += f" {result.skipped} unchanged files skipped."
+        if result.resumed:
+            final_status_msg += f" {result.resumed} already done before the interruption."
         self.status_label.config(text=final_status_msg)
         
         if failed == 0:
-            messagebox.showinfo("Conversion Complete", f"Successfully converted {successful} images!")
+            message = f"Successfully converted {successful} images!"
+            if result.skipped:
+                message += f"\n{result.skipped} unchanged files were already up to date and skipped."
+            if result.resumed:
+                message += f"\n{result.resumed} files were already done before the interruption."
+            if result.deduplicated:
+                message += f"\n{result.deduplicated} conversions avoided: identical sources were linked or copied."
+            if result.passed_through:
+                message += (f"\n{describe_passed_through(result.passed_through)}: "
+                            f"already in the target format, size and quality.")
+            if result.over_budget:
+                message += f"\n{result.over_budget} files are over the max file size even at quality 1."
+            if timing_summary:
+                message += f"\n\n{timing_summary}"
+            messagebox.showinfo("Conversion Complete", message)
         else:
-            error_summary = f"{final_status_msg}\n\nFailed files:\n"
+            error_summary = final_status_msg
+            if result.deduplicated:
+                error_summary += f"\n{result.deduplicated} conversions avoided (identical sources)."
+            if result.passed_through:
+                error_summary += f"\n{describe_passed_through(result.passed_through)}."
+            if result.over_budget:
+                error_summary += f"\n{result.over_budget} files over the max file size even at quality 1."
+            error_summary += "\n\nFailed files:\n"
             for i, (name, err) in enumerate(failed_files_details):
                 if i < 10: # Show details for up to 10 failed files
                     error_summary += f"- {name}: {err}\n"
                 else:
                     error_summary += f"...and {len(failed_files_details) - 10} more.\n"
                     break
+            if timing_summary:
+                error_summary += f"\n{timing_summary}"
             messagebox.showwarning("Conversion Issues", error_summary)
     
+    def export_timings(self):
+        path = filedialog.asksaveasfilename(title="Export Timings", defaultextension=".csv",
+                                            filetypes=[("CSV files", "*.csv"), ("JSON files", "*.json")])
+        if not path:
+            return
+        try:
+            self.last_timings.export(path)
+        except OSError as e:
+            messagebox.showerror("Export Failed", f"Could not write {path}:\n{e}")
+    
     def conversion_error(self, error_message):
+        self.stop_progress_polling()
         self.status_label.config(text="Error during conversion!")
         self.convert_btn.config(state="normal")
         messagebox.showerror("Conversion Error", f"An error occurred:\n{error_message}")
@@ -740,8 +1050,8 @@ def main():
     
     def on_closing():
         if app.is_converting:
-            if messagebox.askokcancel("Quit", "Conversion is in progress. Do you want to quit anyway? This may leave partial files."):
-                # Optionally, add logic here to try and stop the thread gracefully if possible
+            if messagebox.askokcancel("Quit", "Conversion is in progress. Do you want to quit anyway? The remaining files can be resumed the next time the converter starts."):
+                app.cancel_pending_conversions()
                 root.destroy()
         else:
             root.destroy()
@@ -750,4 +1060,5 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Needed for worker processes in frozen executables
     main()
@@ -0,0 +1,309 @@
+"""Streaming (band by band) resize for images too big to decode whole.
+
+A huge scan or panorama used to be decoded in full before resize() could run,
+or refused outright by Pillow's decompression-bomb guard. When a source is
+stored as independently readable row blocks (TIFF strips or tiles, and the
+raw pixel data of uncompressed TIFF, BMP and PPM/PGM files), it can instead
+be read a horizontal band at a time. Each band is box-reduced and resampled
+straight into its rows of the output, with enough extra source rows above
+and below for the filter. When band edges can be put on whole source rows
+the result is identical to resizing the whole image; otherwise rounding can
+differ slightly at the band edges (see stream_resize). Peak memory is one
+band plus the output image.
+
+Compressed TIFFs can be streamed when their strips are PackBits, or
+Deflate without a predictor; LZW and JPEG-compressed TIFFs are decoded
+whole as before.
+"""
+import math
+import struct
+import zlib
+from fractions import Fraction
+
+from PIL import Image, BmpImagePlugin, PpmImagePlugin, TiffImagePlugin
+
+BAND_BYTES = 64 * 1024 ** 2 # Decoded source held per band
+STREAM_MIN_BYTES = 256 * 1024 ** 2 # Decoded size above which sources are streamed when shrinking
+VIRTUAL_STRIP_BYTES = 1024 ** 2 # Uncompressed data is read in row blocks of about this size
+
+# Half-width of each filter's window, in source pixels at a 1:1 scale
+FILTER_SUPPORT = {"NEAREST": 0.5, "BOX": 0.5, "BILINEAR": 1.0, "HAMMING": 1.0, "BICUBIC": 2.0, "LANCZOS": 3.0}
+
+# Bits per pixel of the raw modes stored by the formats streamed here
+RAWMODE_BITS = {
+    "1": 1, "1;I": 1, "L": 8, "L;I": 8, "LA": 16, "I;16": 16, "I;16B": 16, "I;16L": 16,
+    "RGB": 24, "BGR": 24, "RGBA": 32, "RGBa": 32, "BGRA": 32, "RGBX": 32, "BGRX": 32, "CMYK": 32,
+}
+
+_STREAMABLE_MODES = ("1", "L", "LA", "I;16", "I;16B", "I;16L", "RGB", "RGBA", "CMYK")
+_UNCHECKED_OPENERS = ((TiffImagePlugin._accept, TiffImagePlugin.TiffImageFile),
+                      (BmpImagePlugin._accept, BmpImagePlugin.BmpImageFile),
+                      (PpmImagePlugin._accept, PpmImagePlugin.PpmImageFile))
+
+
+def open_unchecked(path):
+    """Open a TIFF, BMP or PPM without the decompression-bomb check, which
+    doesn't apply when the image is going to be streamed. Returns None for
+    other formats."""
+    with open(path, "rb") as f:
+        prefix = f.read(16)
+    for accept, image_class in _UNCHECKED_OPENERS:
+        if accept(prefix):
+            return image_class(path)
+    return None
+
+
+def _stride(rawmode, width):
+    bits = RAWMODE_BITS.get(rawmode)
+    return None if bits is None else (width * bits + 7) // 8
+
+
+class BandSource:
+    """Row blocks of an opened (not loaded) image, decoded on request.
+
+    `blocks` is a list of (y0, y1, pieces), top to bottom, where each piece
+    is (x0, x1, codec, offset, length, rawmode, stride, direction) and
+    covers rows y0..y1 between x0 and x1.
+    """
+
+    def __init__(self, img, blocks):
+        self.img = img
+        self.size = img.size
+        self.mode = img.mode
+        self.blocks = blocks
+
+    def read(self, y0, y1):
+        # Decode every block overlapping rows y0..y1; returns (band, top row)
+        blocks = [block for block in self.blocks if block[1] > y0 and block[0] < y1]
+        top, bottom = blocks[0][0], blocks[-1][1]
+        band = Image.new(self.mode, (self.size[0], bottom - top))
+        fp = self.img.fp
+        for block_y0, block_y1, pieces in blocks:
+            for x0, x1, codec, offset, length, rawmode, stride, direction in pieces:
+                fp.seek(offset)
+                data = fp.read(length)
+                if codec == "deflate":
+                    data, codec = zlib.decompress(data), "raw"
+                args = (rawmode, stride, direction) if codec == "raw" else (rawmode,)
+                decoder = Image._getdecoder(self.mode, codec, args)
+                decoder.setimage(band.im, (x0, block_y0 - top, x1, block_y1 - top))
+                try:
+                    _, error = decoder.decode(data)
+                finally:
+                    decoder.cleanup()
+                if error < 0:
+                    raise OSError(f"Decoding error {error} in rows {block_y0}-{block_y1}")
+        return band, top
+
+
+def _raw_blocks(img, tile):
+    # One raw tile over the whole image: split it into virtual strips
+    args = tile.args if isinstance(tile.args, tuple) else (tile.args, 0, 1)
+    rawmode, stride, direction = (tuple(args) + (0, 1))[:3]
+    width, height = img.size
+    stride = stride or _stride(rawmode, width)
+    if stride is None or direction not in (1, -1):
+        return None
+    rows = max(1, VIRTUAL_STRIP_BYTES // stride)
+    blocks = []
+    for y0 in range(0, height, rows):
+        y1 = min(y0 + rows, height)
+        # Bottom-up files (BMP) store the last row first
+        first_row = y0 if direction == 1 else height - y1
+        blocks.append((y0, y1, [(0, width, "raw", tile.offset + first_row * stride, (y1 - y0) * stride,
+                                 rawmode, stride, direction)]))
+    return blocks
+
+
+def _tiff_blocks(img):
+    tags = img.tag_v2
+    if img._planar_configuration != 1 or tags.get(274, 1) != 1: # Planar data, or an Orientation to apply
+        return None
+    tile = img.tile[0]
+    if img._compression == "raw":
+        if len(img.tile) == 1 and tile.extents == (0, 0) + img.size:
+            return _raw_blocks(img, tile)
+        pieces = []
+        for tile in img.tile:
+            rawmode, stride, direction = tile.args
+            x0, y0, x1, y1 = tile.extents
+            stride = stride or _stride(rawmode, x1 - x0)
+            if stride is None:
+                return None
+            pieces.append((y0, y1, (x0, x1, "raw", tile.offset, (y1 - y0) * stride, rawmode, stride, 1)))
+        return _group_rows(pieces)
+
+    if img._compression == "packbits":
+        codec = "packbits"
+    elif img._compression in ("tiff_adobe_deflate", "tiff_deflate") and tags.get(317, 1) == 1:
+        codec = "deflate"
+    else:
+        return None # LZW, JPEG, predictors...: only libtiff can decode these
+    rawmode = tile.args[0]
+    if set(tags.get(258, (8,))) != {8} or tags.get(266, 1) != 1 or tags.get(262) == 6:
+        return None # Only 8-bit samples in normal fill order, not YCbCr
+    width, height = img.size
+    if 273 in tags:
+        offsets, counts = tags[273], tags.get(279)
+        block_width, block_height = width, tags.get(278, height)
+    else:
+        offsets, counts = tags.get(324), tags.get(325)
+        block_width, block_height = tags.get(322), tags.get(323)
+    if not offsets or not counts or len(offsets) != len(counts) or not block_width or not block_height:
+        return None
+    stride = _stride(rawmode, block_width)
+    if stride is None:
+        return None
+    pieces = []
+    x = y = 0
+    for offset, count in zip(offsets, counts):
+        if y >= height:
+            break
+        pieces.append((y, min(y + block_height, height),
+                       (x, min(x + block_width, width), codec, offset, count, rawmode, stride, 1)))
+        x += block_width
+        if x >= width:
+            x, y = 0, y + block_height
+    return _group_rows(pieces)
+
+
+def _group_rows(pieces):
+    # (y0, y1, piece) in file order -> [(y0, y1, [pieces])] top to bottom
+    rows = {}
+    for y0, y1, piece in pieces:
+        rows.setdefault((y0, y1), []).append(piece)
+    return [(y0, y1, rows[(y0, y1)]) for y0, y1 in sorted(rows)]
+
+
+def _row_bytes(mode, width):
+    return width * (1 if mode in ("1", "L") else 2 if mode.startswith("I;16") else 4)
+
+
+def band_source(img):
+    """Return a BandSource for the opened, not yet loaded `img`, or None if
+    it can't be read in bands (or its blocks are too tall to help)."""
+    if img.mode not in _STREAMABLE_MODES or getattr(img, "n_frames", 1) != 1 or not img.tile:
+        return None
+    try:
+        if img.format == "TIFF":
+            blocks = _tiff_blocks(img)
+        elif img.format in ("BMP", "PPM") and len(img.tile) == 1 and img.tile[0].codec_name == "raw":
+            blocks = _raw_blocks(img, img.tile[0])
+        else:
+            return None
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+    if not blocks or max(y1 - y0 for y0, y1, _ in blocks) * _row_bytes(img.mode, img.width) > BAND_BYTES:
+        return None
+    return BandSource(img, blocks)
+
+
+def should_stream(size, mode, new_size):
+    # Worth it only when shrinking something big
+    if new_size is None or new_size[0] >= size[0] or new_size[1] >= size[1]:
+        return False
+    return _row_bytes(mode, size[0]) * size[1] > STREAM_MIN_BYTES
+
+
+def _float32(value):
+    # Pillow hands resize boxes to C as 32-bit floats
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def _nearest_rows(mode, height, out_height):
+    # The source row Image.resize takes for each output row with NEAREST. For
+    # most modes it adds up the step in a double, so the same sum is replayed
+    # here: working it out per row can land on the other side of a tie. The
+    # 16-bit modes go through Pillow's generic transform, which does that.
+    step = _float32(height) / out_height
+    if mode.startswith("I;16"):
+        return [min(int((y + 0.5) * step), height - 1) for y in range(out_height)]
+    position = step * 0.5
+    rows = []
+    for _ in range(out_height):
+        rows.append(min(int(position), height - 1))
+        position += step
+    return rows
+
+
+def _stream_nearest(source, new_size):
+    # NEAREST: pick the source rows of each band, then scale only across
+    width, height = source.size
+    out_width, out_height = new_size
+    source_rows = _nearest_rows(source.mode, height, out_height)
+    band_rows = max(int(BAND_BYTES / _row_bytes(source.mode, width) * out_height / height), 1)
+    output = Image.new(source.mode, new_size)
+    for out_y0 in range(0, out_height, band_rows):
+        rows = source_rows[out_y0:out_y0 + band_rows]
+        band, top = source.read(rows[0], rows[-1] + 1)
+        picked = Image.new(source.mode, (width, len(rows)))
+        for y, row in enumerate(rows):
+            picked.paste(band.crop((0, row - top, width, row - top + 1)), (0, y))
+        output.paste(picked.resize((out_width, len(rows)), Image.Resampling.NEAREST), (0, out_y0))
+    return output
+
+
+def stream_resize(source, new_size, resample="LANCZOS", reducing_gap=None):
+    """Resize a BandSource to `new_size` one band at a time.
+
+    Mirrors Image.resize: the box reduction (with `reducing_gap`) works on
+    bands whose first row is a multiple of the reduction factor, so every
+    band reduces exactly the blocks the whole image would, and each output
+    band is resampled from the rows its filter window covers. NEAREST takes
+    the very rows Image.resize would.
+
+    Other filters only match Image.resize exactly when each band starts on
+    a whole source row, which the band height is rounded to when it can be.
+    If not, the 32-bit box edges make the weights differ in their last
+    bits: results are within 1 level (premultiplied, for alpha images), and
+    BOX can shift a source row between neighbouring outputs.
+    """
+    width, height = source.size
+    out_width, out_height = new_size
+    if source.mode == "1" or resample == "NEAREST":
+        return _stream_nearest(source, new_size) # Image.resize uses NEAREST for "1" too
+    # Like Image.resize, filter alpha images with premultiplied colours (and
+    # without the box reduction, which Image.resize skips for them too)
+    work_mode = {"LA": "La", "RGBA": "RGBa"}.get(source.mode)
+    factor_x = factor_y = 1
+    if reducing_gap is not None and not work_mode:
+        factor_x = int(width / out_width / reducing_gap) or 1
+        factor_y = int(height / out_height / reducing_gap) or 1
+    reduced_width, reduced_height = width / factor_x, height / factor_y
+    scale = reduced_height / out_height # Reduced rows per output row
+    margin = math.ceil(FILTER_SUPPORT[resample] * max(scale, 1.0)) + 2
+
+    band_rows = max(int((BAND_BYTES / _row_bytes(source.mode, width) - 2 * margin * factor_y)
+                        / (scale * factor_y)), 1)
+    # Each band's resize box is stored as 32-bit floats. When every band
+    # starts at an output row whose source row is a whole number, the box is
+    # stored exactly and the band gets the same filter coefficients as the
+    # whole image; otherwise they can differ in the last bits.
+    exact_scale = Fraction(_float32(reduced_height)) / out_height
+    if exact_scale.denominator <= band_rows:
+        band_rows -= band_rows % exact_scale.denominator
+    output = Image.new(work_mode or source.mode, new_size)
+    for out_y0 in range(0, out_height, band_rows):
+        out_y1 = min(out_y0 + band_rows, out_height)
+        # Reduced rows the filter windows of these output rows reach
+        first = max(int(out_y0 * scale) - margin, 0)
+        last = min(math.ceil(out_y1 * scale) + margin, math.ceil(reduced_height))
+        band, top = source.read(first * factor_y, min(last * factor_y, height))
+        # Trim the band to whole reduction blocks (a short block is only
+        # allowed at the bottom of the image, as in Image.reduce)
+        start = -(-top // factor_y) * factor_y
+        end = top + band.height
+        if end < height:
+            end = start + (end - start) // factor_y * factor_y
+        if (start, end) != (top, top + band.height):
+            band = band.crop((0, start - top, band.width, end - top))
+        reduced_top = start // factor_y
+        if work_mode:
+            band = band.convert(work_mode)
+        if factor_x > 1 or factor_y > 1:
+            band = band.reduce((factor_x, factor_y))
+        piece = band.resize((out_width, out_y1 - out_y0), Image.Resampling[resample],
+                            box=(0, float(out_y0 * exact_scale - reduced_top), reduced_width,
+                                 float(out_y1 * exact_scale - reduced_top)))
+        output.paste(piece, (0, out_y0))
+    return output.convert(source.mode) if work_mode else output
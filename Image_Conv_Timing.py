@@ -0,0 +1,98 @@
+"""Per-file performance report of a batch.
+
+Workers time every stage of each conversion into a FileTiming (see
+Image_Conv_Engine); the batch collects them in a TimingReport, which sums
+them up as percentiles per stage plus the slowest files, and exports the raw
+records as CSV or JSON for a closer look. Skipped, resumed and deduplicated
+files did no work and have no timing.
+Nothing in here touches Tk.
+"""
+import csv
+import json
+import os
+
+from Image_Conv_Engine import STAGES
+
+STAGE_LABELS = {"decode": "open/decode", "resize": "resize", "convert": "mode conversion",
+                "encode": "encode", "write": "write"}
+FIELDS = ("source", "target_format", "input_bytes", "output_bytes", "mode", "quality", "fast_path",
+          "over_budget") + STAGES + ("total",)
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(int(fraction * len(sorted_values) + 0.5), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class TimingReport:
+    def __init__(self):
+        self.timings = []
+
+    def __len__(self):
+        return len(self.timings)
+
+    def add(self, timing):
+        self.timings.append(timing)
+
+    def stage_percentiles(self, fractions=(0.5, 0.95)):
+        """Return {stage: [seconds at each fraction]}, plus "total"."""
+        result = {}
+        for stage in STAGES + ("total",):
+            values = sorted(getattr(timing, stage) for timing in self.timings)
+            result[stage] = [percentile(values, fraction) for fraction in fractions]
+        return result
+
+    def stage_totals(self):
+        return {stage: sum(getattr(timing, stage) for timing in self.timings) for stage in STAGES}
+
+    def slowest(self, count=10):
+        return sorted(self.timings, key=lambda timing: timing.total, reverse=True)[:count]
+
+    def format_summary(self, slowest=10):
+        # Plain text for the completion dialog and the command line
+        if not self.timings:
+            return ""
+        totals = self.stage_totals()
+        busy = sum(totals.values()) or 1.0
+        lines = [f"Time per file over {len(self.timings):,} conversions (p50 / p95, share of total):"]
+        for stage, (p50, p95) in self.stage_percentiles().items():
+            label = STAGE_LABELS.get(stage, stage)
+            share = f"  {totals[stage] / busy:4.0%}" if stage in totals else ""
+            lines.append(f"  {label:<16} {p50 * 1000:8.1f} / {p95 * 1000:8.1f} ms{share}")
+        qualities = sorted(timing.quality for timing in self.timings if isinstance(timing.quality, int))
+        if qualities and qualities[0] != qualities[-1]:
+            # Chosen per file to meet a size limit
+            lines.append(f"  Quality used: {qualities[0]} to {qualities[-1]}, median {percentile(qualities, 0.5)}")
+        lines.append(f"Slowest {min(slowest, len(self.timings))} files:")
+        for timing in self.slowest(slowest):
+            # Name the stage that took most of the file's time
+            worst = max(STAGES, key=lambda stage: getattr(timing, stage))
+            lines.append(f"  {os.path.basename(timing.source)} -> {timing.target_format}: "
+                         f"{timing.total:.2f} s, mostly {STAGE_LABELS[worst]}")
+        return "\n".join(lines)
+
+    def rows(self):
+        for timing in self.timings:
+            row = [getattr(timing, field) for field in FIELDS]
+            yield [round(value, 6) if isinstance(value, float) else value for value in row]
+
+    def write_csv(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            writer.writerows(self.rows())
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"stages": list(STAGES),
+                       "files": [dict(zip(FIELDS, row)) for row in self.rows()]}, f, indent=1)
+
+    def export(self, path):
+        # Format by extension: .json, anything else is CSV
+        if str(path).lower().endswith(".json"):
+            self.write_json(path)
+        else:
+            self.write_csv(path)
@@ -0,0 +1,74 @@
+"""Benchmark for the encoder effort presets: encode time vs. output size.
+
+    python benchmarks/bench_effort.py [--repeat 3] [--images photo.jpg ...]
+
+Encodes each test image to JPEG, PNG and WEBP at quality 85 with every
+preset in EFFORT_PRESETS, through save_image, and reports the median encode
+time (the FileTiming "encode" stage, so the write isn't counted) and the
+output size, plus both relative to "balanced". The default images are the
+synthetic photo, alpha_png and palette_gif kinds of bench_pipeline's corpus
+at --size; synthetic texture doesn't compress like a real photo (progressive
+JPEG comes out bigger on it, where it saves a few percent on photos), so pass
+real files with --images for numbers that match your own.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from Image_Conv_Engine import (DEFAULT_EFFORT, EFFORT_FORMATS, EFFORT_PRESETS, FileTiming,
+                               output_extension, prepare_for_format, save_image)
+from bench_pipeline import make_image
+
+SYNTHETIC_KINDS = ("photo", "alpha_png", "palette_gif")
+
+
+def encode_timed(img, target_format, effort, output, repeat):
+    # Median encode seconds over `repeat` runs, and the output size
+    times = []
+    for _ in range(repeat):
+        timing = FileTiming(output, target_format)
+        save_image(img, output, target_format, 85, timing=timing, effort=effort)
+        times.append(timing.encode)
+    return statistics.median(times), os.path.getsize(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", nargs="+", metavar="FILE", help="Real images to encode instead")
+    parser.add_argument("--size", type=int, nargs=2, default=(1600, 1200), metavar=("W", "H"),
+                        help="Size of the synthetic images (default: 1600 1200)")
+    parser.add_argument("--repeat", type=int, default=3, help="Encodes per case; the median is reported")
+    parser.add_argument("--formats", nargs="+", type=str.upper, choices=EFFORT_FORMATS, default=EFFORT_FORMATS)
+    args = parser.parse_args()
+
+    if args.images:
+        images = []
+        for path in args.images:
+            with Image.open(path) as img:
+                images.append((Path(path).name, img.copy()))
+    else:
+        images = [(kind, make_image(kind, 0, tuple(args.size), 1)) for kind in SYNTHETIC_KINDS]
+
+    with tempfile.TemporaryDirectory() as scratch:
+        for name, img in images:
+            print(f"{name} ({img.width}x{img.height} {img.mode}):")
+            for target_format in args.formats:
+                prepared = prepare_for_format(img, target_format)
+                output = os.path.join(scratch, f"out{output_extension(target_format)}")
+                results = {effort: encode_timed(prepared, target_format, effort, output, args.repeat)
+                           for effort in EFFORT_PRESETS}
+                base_seconds, base_bytes = results[DEFAULT_EFFORT]
+                for effort, (seconds, size) in results.items():
+                    print(f"  {target_format:<5} {effort:<9} {seconds * 1000:9.1f} ms {size:>11,} bytes"
+                          f"  {seconds / base_seconds:5.2f}x time  {size / base_bytes:6.1%} size")
+
+
+if __name__ == "__main__":
+    main()
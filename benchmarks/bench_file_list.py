@@ -0,0 +1,130 @@
+"""Benchmark for the file list: legacy list scan vs. the indexed model.
+
+    python benchmarks/bench_file_list.py [--sizes 500 1000 2000 100000]
+
+The legacy numbers replay the Python side of the old browse_files /
+update_file_list (list-based dedup plus matching every tree row against every
+selected path by name) with the Treeview calls stubbed out, so they are a
+lower bound for the old code. The model numbers cover add_many, building the
+rows and diffing them against what the tree shows.
+
+If a display is available, the real GUI is also timed: adding N files to an
+ImageConverter and reporting the longest single event-loop stall while the
+rows are inserted in batches.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Image_Conv_FileList import FileListModel, diff_rows
+
+LEGACY_LIMIT = 2000 # Quadratic; 5000 files already takes about a minute
+
+
+def make_paths(n):
+    return [f"/photos/day{i % 365:03d}/IMG_{i:07d}.JPG" for i in range(n)]
+
+
+def legacy_add(paths):
+    # browse_files + update_file_list before the model (Tk calls stubbed out)
+    selected_files = []
+    new_files = [f for f in paths if f not in selected_files]
+    selected_files.extend(new_files)
+
+    tree_items_map = {} # Empty tree on the first add
+    for file_path in selected_files:
+        tree_items_map[Path(file_path).name] = file_path
+
+    # The refresh that follows any later change: every row against every path
+    for filename, item_id in list(tree_items_map.items()):
+        for f_path in selected_files:
+            if Path(f_path).name == filename:
+                break
+    return selected_files
+
+
+def model_add(paths):
+    model = FileListModel()
+    model.add_many(paths)
+    wanted_rows = {}
+    for entry in model.entries():
+        wanted_rows[entry.path] = (entry.name, ("1.0 MB", "JPG", "JPEG"))
+    diff_rows({}, wanted_rows)
+
+    # A refresh where nothing changed
+    start = time.perf_counter()
+    to_delete, to_update, to_insert = diff_rows(wanted_rows, dict(wanted_rows))
+    assert not (to_delete or to_update or to_insert)
+    noop_time = time.perf_counter() - start
+
+    # Lookups and removals
+    start = time.perf_counter()
+    for path in paths[::10]:
+        assert path in model
+    for path in paths[::10]:
+        model.remove(path)
+    lookup_time = time.perf_counter() - start
+    return noop_time, lookup_time
+
+
+def time_call(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_gui(n):
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"  GUI: skipped ({e})")
+        return
+    import Image_Conv_ResizV2 as gui
+
+    root.withdraw()
+    app = gui.ImageConverter(root)
+    paths = make_paths(n)
+    start = time.perf_counter()
+    app.selected_files.add_many(paths)
+    app.update_file_list() # stat() and header reads run on the metadata loader's threads
+    first_call = time.perf_counter() - start
+
+    longest_tick = 0.0
+    while app.pending_rows:
+        tick_start = time.perf_counter()
+        app.insert_pending_rows()
+        longest_tick = max(longest_tick, time.perf_counter() - tick_start)
+        root.update()
+    total = time.perf_counter() - start
+    print(f"  GUI: update_file_list {first_call:.3f}s, all rows shown after {total:.2f}s, "
+          f"longest stall {longest_tick * 1000:.0f} ms")
+    root.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[500, 1000, 2000, 100000])
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        paths = make_paths(n)
+        print(f"{n} files:")
+        if n <= LEGACY_LIMIT:
+            legacy_time, _ = time_call(legacy_add, paths)
+            print(f"  legacy list:   {legacy_time:8.3f}s")
+        else:
+            print(f"  legacy list:   skipped (quadratic; > {LEGACY_LIMIT} files)")
+        model_time, (noop_time, lookup_time) = time_call(model_add, paths)
+        print(f"  indexed model: {model_time:8.3f}s  (no-op refresh {noop_time * 1000:.1f} ms, "
+              f"{n // 10} lookups + removals {lookup_time * 1000:.1f} ms)")
+        if n == max(args.sizes):
+            bench_gui(n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark for output naming: the old exists() probe loop vs. OutputNames.
+
+    python benchmarks/bench_output_names.py [--files 100000] [--stems 100]
+
+Names N outputs into one flat directory, for N distinct source names and
+for N sources sharing --stems names (camera dumps full of IMG_0001.JPG, where
+every output needs a _1, _2 ... suffix), each into an empty directory and
+into one already holding the outputs of an earlier run of the same batch.
+The legacy numbers replay the old choose_output_path, whose collision loop
+probes every suffix in turn and is quadratic with many collisions, so those
+cases only run up to LEGACY_LIMIT files. Filesystem calls are counted by
+wrapping os.stat, os.open and os.scandir; every output is created, as the
+conversion would.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Image_Conv_Engine import OutputNames
+
+LEGACY_LIMIT = 20000
+
+
+class SyscallCounter:
+    # Counts calls to the os functions the naming code can reach
+    NAMES = ("stat", "open", "scandir")
+
+    def __init__(self):
+        self.count = 0
+        self._saved = {}
+
+    def __enter__(self):
+        for name in self.NAMES:
+            original = self._saved[name] = getattr(os, name)
+
+            def counted(*args, _original=original, **kwargs):
+                self.count += 1
+                return _original(*args, **kwargs)
+            setattr(os, name, counted)
+        return self
+
+    def __exit__(self, *exc):
+        for name, original in self._saved.items():
+            setattr(os, name, original)
+
+
+def legacy_name(source_path, output_dir, reserved):
+    # choose_output_path before the allocator (it didn't create the file)
+    source_path = Path(source_path)
+    name_stem, name_ext = source_path.stem, ".jpeg"
+    final_output_path = Path(output_dir) / f"{name_stem}{name_ext}"
+    counter = 1
+    while final_output_path in reserved or final_output_path.exists():
+        final_output_path = Path(output_dir) / f"{name_stem}_{counter}{name_ext}"
+        counter += 1
+    reserved.add(final_output_path)
+    open(final_output_path, "wb").close() # Stands in for the conversion writing it
+    return final_output_path
+
+
+def allocator_names(sources, output_dir):
+    names = OutputNames()
+    for source in sources:
+        names.written(names.allocate(source, "JPEG", output_dir))
+
+
+def earlier_outputs(sources, output_dir):
+    # Real outputs of an earlier run, not the empty claims of a killed one
+    names = OutputNames()
+    for source in sources:
+        path = names.allocate(source, "JPEG", output_dir)
+        path.write_bytes(b"\xff\xd8")
+        names.written(path)
+
+
+def legacy_names(sources, output_dir):
+    reserved = set()
+    for source in sources:
+        legacy_name(source, output_dir, reserved)
+
+
+def run(fn, sources, earlier_run=False):
+    with tempfile.TemporaryDirectory() as output_dir:
+        if earlier_run:
+            earlier_outputs(sources, output_dir)
+        with SyscallCounter() as counter:
+            start = time.perf_counter()
+            fn(sources, output_dir)
+            elapsed = time.perf_counter() - start
+    return elapsed, counter.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--stems", type=int, default=100, help="Distinct names in the colliding case")
+    args = parser.parse_args()
+
+    distinct = [f"/photos/IMG_{i:07d}.JPG" for i in range(args.files)]
+    shared = [f"/card{i // args.stems}/IMG_{i % args.stems:04d}.JPG" for i in range(args.files)]
+    for label, sources, earlier_run in (("distinct names, empty directory", distinct, False),
+                                        ("distinct names, earlier outputs present", distinct, True),
+                                        (f"{args.stems} names, empty directory", shared, False),
+                                        (f"{args.stems} names, earlier outputs present", shared, True)):
+        print(f"{args.files:,} outputs, {label}:")
+        if sources is shared and args.files > LEGACY_LIMIT:
+            print(f"  legacy loop: skipped (quadratic; > {LEGACY_LIMIT:,} files)")
+        else:
+            elapsed, calls = run(legacy_names, sources, earlier_run)
+            print(f"  legacy loop: {elapsed:8.2f}s  {calls:>12,} calls")
+        elapsed, calls = run(allocator_names, sources, earlier_run)
+        print(f"  allocator:   {elapsed:8.2f}s  {calls:>12,} calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Benchmark for the conversion pipeline, stage by stage.
+
+    python benchmarks/bench_pipeline.py [-o results.json] [--compare baseline.json]
+
+Generates a synthetic corpus (same seed, same pixels on every run) and
+converts every corpus kind to every output format, timing each stage of
+convert_single_file separately:
+
+- decode: Image.open plus load, including the JPEG draft scale;
+- resize: resize_image down to the target size;
+- convert: prepare_for_format, the mode conversion for the target;
+- encode: save_image to a scratch directory.
+
+Each kind/format case runs in a fresh process, so its peak RSS is its own.
+Results (per-stage seconds, images/s, MB/s of source read, peak RSS) are
+written as JSON. With --compare, the run is checked against an earlier
+results file and the script exits with status 1 if any case got slower or
+bigger than --threshold allows, so it can gate a change in CI.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL
+from PIL import Image
+
+from Image_Conv_Engine import (OUTPUT_FORMATS, ICO_SIZES, MAX_ICO_SIZE, DEFAULT_REDUCING_GAP, DEFAULT_RESAMPLE,
+                               compute_target_size, fit_within, output_extension, prepare_for_format,
+                               resize_image, save_image)
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+CORPUS_VERSION = 1 # Bump when the generator changes, so old corpora are rebuilt
+STAGES = ("decode", "resize", "convert", "encode")
+
+# kind -> (count, (width, height) at scale 1, file extension)
+CORPUS_KINDS = {
+    "photo": (6, (4000, 3000), ".jpg"),
+    "alpha_png": (6, (1600, 1200), ".png"),
+    "palette_gif": (8, (800, 600), ".gif"),
+    "huge_tiff": (1, (12000, 8000), ".tif"),
+    "icon": (40, (48, 48), ".png"),
+}
+
+
+def texture(rng, size, mode="RGB", grain=4):
+    # Smooth, photo-like content: coarse random noise blown up with a bicubic
+    # filter, plus a finer layer so encoders have some detail to chew on.
+    # Only Python's seeded RNG and Pillow's deterministic resize are involved.
+    bands = len(mode)
+    layers = []
+    for cells in (8, 8 * grain):
+        cell_size = (cells, max(1, round(cells * size[1] / size[0])))
+        noise = Image.frombytes(mode, cell_size, rng.randbytes(cell_size[0] * cell_size[1] * bands))
+        layers.append(noise.resize(size, Image.Resampling.BICUBIC))
+    return Image.blend(layers[0], layers[1], 0.3)
+
+
+def make_image(kind, index, size, seed):
+    rng = random.Random(f"{seed}:{kind}:{index}")
+    if kind == "alpha_png" or kind == "icon":
+        img = texture(rng, size, "RGB").convert("RGBA")
+        # A soft-edged blob of opacity, so the alpha channel isn't trivial
+        alpha = Image.radial_gradient("L").resize(size, Image.Resampling.BILINEAR)
+        img.putalpha(alpha.point(lambda v: 255 - v))
+        return img
+    if kind == "palette_gif":
+        return texture(rng, size, "RGB", grain=2).quantize(colors=128)
+    return texture(rng, size, "RGB")
+
+
+def build_corpus(corpus_dir, seed, scale):
+    """Create the corpus in `corpus_dir` unless an identical one is already
+    there. Returns {kind: [paths]}."""
+    corpus_dir = Path(corpus_dir)
+    stamp_path = corpus_dir / "corpus.json"
+    stamp = {"version": CORPUS_VERSION, "seed": seed, "scale": scale}
+    corpus = {kind: [corpus_dir / f"{kind}_{i:03d}{ext}" for i in range(count)]
+              for kind, (count, _, ext) in CORPUS_KINDS.items()}
+    try:
+        if json.loads(stamp_path.read_text()) == stamp and all(p.exists() for ps in corpus.values() for p in ps):
+            return corpus
+    except (OSError, ValueError):
+        pass
+
+    print(f"Generating corpus in {corpus_dir} (seed {seed}, scale {scale}) ...")
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    for kind, paths in corpus.items():
+        count, base_size, ext = CORPUS_KINDS[kind]
+        # Icons stay tiny whatever the scale
+        size = base_size if kind == "icon" else (max(1, int(base_size[0] * scale)), max(1, int(base_size[1] * scale)))
+        for i, path in enumerate(paths):
+            img = make_image(kind, i, size, seed)
+            if ext == ".jpg":
+                img.save(path, quality=90)
+            else:
+                img.save(path) # Uncompressed for TIFF, like a scanner would write it
+    stamp_path.write_text(json.dumps(stamp))
+    return corpus
+
+
+def peak_rss_mb():
+    # Linux carries ru_maxrss over an exec, so a spawned worker would report
+    # the parent's peak; VmHWM starts afresh with the new process image
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def convert_timed(path, target_format, width, scratch, quality=85, resample=DEFAULT_RESAMPLE):
+    # convert_single_file, split at its stage boundaries
+    times = {}
+    start = time.perf_counter()
+    with Image.open(path) as img:
+        new_size = compute_target_size(img.size, "fit_width", width, None, None, True)
+        if target_format == "ICO":
+            largest = min(max(ICO_SIZES), MAX_ICO_SIZE)
+            new_size = fit_within(new_size or img.size, (largest, largest))
+        resizing = new_size is not None and new_size != img.size
+        if resizing and img.format == "JPEG" and new_size[0] < img.width and new_size[1] < img.height:
+            img.draft(None, new_size) # What resize_image would do before decoding
+        img.load()
+        lap = time.perf_counter()
+        times["decode"] = lap - start
+
+        resized = resize_image(img, new_size, DEFAULT_REDUCING_GAP, True, resample) if resizing else img
+        start, lap = lap, time.perf_counter()
+        times["resize"] = lap - start
+
+        prepared = prepare_for_format(resized, target_format)
+        start, lap = lap, time.perf_counter()
+        times["convert"] = lap - start
+
+        output = scratch / f"out{output_extension(target_format)}"
+        save_image(prepared, output, target_format, quality, ICO_SIZES, resample)
+        times["encode"] = time.perf_counter() - lap
+    return times, output.stat().st_size
+
+
+def run_case(paths, target_format, width, repeat):
+    """Convert `paths` to `target_format` `repeat` times; runs in its own process."""
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch = Path(scratch)
+        runs = []
+        output_bytes = 0
+        for _ in range(repeat):
+            totals = dict.fromkeys(STAGES, 0.0)
+            output_bytes = 0
+            for path in paths:
+                times, size = convert_timed(path, target_format, width, scratch)
+                for stage in STAGES:
+                    totals[stage] += times[stage]
+                output_bytes += size
+            runs.append(totals)
+    # Median of the repeats, stage by stage
+    stages = {stage: statistics.median(run[stage] for run in runs) for stage in STAGES}
+    return stages, output_bytes, peak_rss_mb()
+
+
+def run_benchmark(corpus, formats, width, repeat):
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for kind, paths in corpus.items():
+        source_bytes = sum(os.path.getsize(p) for p in paths)
+        for target_format in formats:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                stages, output_bytes, rss = executor.submit(run_case, [str(p) for p in paths], target_format,
+                                                            width, repeat).result()
+            total = sum(stages.values())
+            case = {
+                "images": len(paths),
+                "source_bytes": source_bytes,
+                "output_bytes": output_bytes,
+                "stages": {stage: round(seconds, 6) for stage, seconds in stages.items()},
+                "total_s": round(total, 6),
+                "images_per_s": round(len(paths) / total, 3) if total else None,
+                "mb_per_s": round(source_bytes / 1024 ** 2 / total, 3) if total else None,
+                "peak_rss_mb": round(rss, 1) if rss is not None else None,
+            }
+            results[f"{kind}/{target_format}"] = case
+            stage_text = "  ".join(f"{stage} {stages[stage] * 1000:7.1f}" for stage in STAGES)
+            rss_text = f"{rss:7.1f} MB" if rss is not None else "      n/a"
+            print(f"  {kind + '/' + target_format:18} {stage_text} ms | {case['images_per_s']:8.2f} img/s "
+                  f"{case['mb_per_s']:7.2f} MB/s | RSS {rss_text}")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the change of every case against `baseline`; return the cases
+    that got slower (images/s) or grew (peak RSS) by more than `threshold`."""
+    regressions = []
+    print(f"\nAgainst baseline (threshold {threshold:.0%}):")
+    for key, case in results.items():
+        old = baseline.get(key)
+        if old is None:
+            print(f"  {key:18} new case")
+            continue
+        speed = case["images_per_s"] / old["images_per_s"] - 1 if old["images_per_s"] else 0.0
+        line = f"  {key:18} images/s {speed:+7.1%}"
+        stage_changes = []
+        for stage in STAGES:
+            if old["stages"].get(stage):
+                stage_changes.append(f"{stage} {case['stages'][stage] / old['stages'][stage] - 1:+.0%}")
+        line += "  (" + ", ".join(stage_changes) + ")"
+        if speed < -threshold:
+            regressions.append(f"{key}: images/s {speed:+.1%}")
+            line += "  SLOWER"
+        if case["peak_rss_mb"] and old.get("peak_rss_mb"):
+            growth = case["peak_rss_mb"] / old["peak_rss_mb"] - 1
+            if growth > threshold:
+                regressions.append(f"{key}: peak RSS {growth:+.1%}")
+                line += f"  RSS {growth:+.0%}"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", default="bench_pipeline.json", help="results file to write")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results file to check against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed slowdown / RSS growth per case before failing (default 0.10)")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "image_conv_bench_corpus"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="linear scale of the corpus images (icons excepted); 0.25 for a quick run")
+    parser.add_argument("--width", type=int, default=1600, help="fit-to-width target of the resize")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument("--kinds", nargs="+", choices=list(CORPUS_KINDS), default=list(CORPUS_KINDS))
+    parser.add_argument("--formats", nargs="+", choices=OUTPUT_FORMATS, default=OUTPUT_FORMATS)
+    args = parser.parse_args()
+
+    workload = {"corpus_version": CORPUS_VERSION, "seed": args.seed, "scale": args.scale, "width": args.width}
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        # Cases are only comparable on the same corpus and workload
+        for key, value in workload.items():
+            if baseline["meta"].get(key) != value:
+                parser.error(f"baseline was run with {key}={baseline['meta'].get(key)}; rerun with the same value")
+
+    corpus = build_corpus(args.corpus_dir, args.seed, args.scale)
+    corpus = {kind: corpus[kind] for kind in args.kinds}
+    print(f"Pillow {PIL.__version__}, Python {platform.python_version()}, {os.cpu_count()} CPUs")
+    results = run_benchmark(corpus, args.formats, args.width, args.repeat)
+
+    meta = dict(workload)
+    meta.update({
+        "repeat": args.repeat,
+        "pillow": PIL.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if baseline is not None:
+        if baseline["meta"].get("pillow") != PIL.__version__:
+            print(f"Note: baseline used Pillow {baseline['meta'].get('pillow')}")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""BatchRunner fed by a lazy walk that reaches the batch's own outputs."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from Image_Conv_Batch import BatchRunner, iter_input_files
+from Image_Conv_Engine import ConversionSettings
+
+
+def test_own_outputs_are_not_converted_again(tmp_path):
+    source = tmp_path / "p0.bmp"
+    Image.new("RGB", (64, 48)).save(source)
+    settings = ConversionSettings("PNG")
+
+    def walk():
+        # Like a scandir listing taken after the first output was claimed
+        yield str(source), settings
+        for name in sorted(os.listdir(tmp_path)):
+            if name != source.name and not name.startswith("."):
+                yield str(tmp_path / name), settings
+        yield str(tmp_path / ".p0.png.123.part"), settings
+
+    result = BatchRunner(1).run(walk())
+    assert (result.successful, result.failed, result.skipped) == (1, 0, 0)
+    assert sorted(os.listdir(tmp_path)) == [".imgconv_manifest.jsonl", "p0.bmp", "p0.png"]
+
+
+def test_output_directory_inside_the_tree_is_not_walked(tmp_path):
+    for folder in ("sub", "out"):
+        (tmp_path / folder).mkdir()
+        Image.new("RGB", (8, 8)).save(tmp_path / folder / "p0.png")
+    found = list(iter_input_files([str(tmp_path)], recursive=True, exclude=[str(tmp_path / "out")]))
+    assert found == [str(tmp_path / "sub" / "p0.png")]
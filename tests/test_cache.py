@@ -0,0 +1,24 @@
+"""Re-run cache: repeated runs over a folder holding their own outputs."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from Image_Conv_Batch import BatchRunner, iter_input_files
+from Image_Conv_Engine import ConversionSettings
+
+
+def test_rerun_does_not_convert_earlier_outputs(tmp_path):
+    for i in range(3):
+        Image.new("RGB", (32, 24), (i * 80, 0, 0)).save(tmp_path / f"x{i}.bmp")
+    settings = ConversionSettings("PNG")
+    expected = sorted([".imgconv_manifest.jsonl"] + [f"x{i}.{ext}" for i in range(3) for ext in ("bmp", "png")])
+
+    for run, skip_unchanged in enumerate((True, True, False)):
+        sources = ((path, settings) for path in iter_input_files([str(tmp_path)]))
+        result = BatchRunner(1, skip_unchanged=skip_unchanged).run(sources)
+        converted = 3 if run != 1 else 0
+        assert (result.successful, result.skipped, result.failed) == (converted, 3 - converted, 0)
+        assert sorted(os.listdir(tmp_path)) == expected
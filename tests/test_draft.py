@@ -0,0 +1,50 @@
+"""Draft (reduced DCT scale) JPEG decoding stays close to a full decode."""
+import io
+import math
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageChops, ImageStat
+
+from Image_Conv_Engine import compute_target_size, resize_image
+
+MIN_PSNR = 40.0 # dB; measured around 45-53 dB when draft decoding was added
+
+
+def synthetic_jpeg(size=(2400, 1800), seed=3):
+    # Smooth photo-like content plus finer detail, from a seeded RNG only
+    rng = random.Random(seed)
+    layers = []
+    for cells in (8, 64):
+        cell_size = (cells, cells * size[1] // size[0])
+        noise = Image.frombytes("RGB", cell_size, rng.randbytes(cell_size[0] * cell_size[1] * 3))
+        layers.append(noise.resize(size, Image.Resampling.BICUBIC))
+    encoded = io.BytesIO()
+    Image.blend(layers[0], layers[1], 0.3).save(encoded, "JPEG", quality=90)
+    return encoded.getvalue()
+
+
+def psnr(a, b):
+    rms = ImageStat.Stat(ImageChops.difference(a, b)).rms
+    mse = sum(value ** 2 for value in rms) / len(rms)
+    return float("inf") if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+@pytest.mark.parametrize("size_mode, width, percentage", [("fit_width", 1000, None), ("fit_width", 600, None),
+                                                          ("percentage", None, 25.0)])
+def test_draft_decode_matches_full_decode(size_mode, width, percentage):
+    data = synthetic_jpeg()
+    results = {}
+    for use_draft in (True, False):
+        with Image.open(io.BytesIO(data)) as img:
+            new_size = compute_target_size(img.size, size_mode, width, None, percentage, True)
+            results[use_draft] = resize_image(img, new_size, use_draft=use_draft)
+            if use_draft:
+                assert img.size != (2400, 1800) # Drafted to a reduced scale
+    assert results[True].size == results[False].size
+    assert psnr(results[True], results[False]) >= MIN_PSNR
@@ -0,0 +1,45 @@
+"""OutputNames: collisions, empty files on disk, and claims left by a killed batch."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Image_Conv_Engine import OutputNames
+
+
+def test_collisions_get_suffixes(tmp_path):
+    (tmp_path / "p0.png").write_bytes(b"earlier output")
+    names = OutputNames()
+    first = names.allocate("/a/p0.jpg", "PNG", tmp_path)
+    second = names.allocate("/b/p0.jpg", "PNG", tmp_path)
+    assert (first.name, second.name) == ("p0_1.png", "p0_2.png")
+
+
+def test_empty_files_are_never_taken_over(tmp_path):
+    # An empty file may be the user's, not a claim a killed batch left behind
+    (tmp_path / "p0.png").touch()
+    names = OutputNames()
+    assert names.allocate("/a/p0.jpg", "PNG", tmp_path).name == "p0_1.png"
+    names.release_all()
+    assert sorted(os.listdir(tmp_path)) == ["p0.png"]
+
+
+def test_source_is_never_its_own_output(tmp_path):
+    source = tmp_path / "keep.png"
+    source.touch()
+    names = OutputNames()
+    path = names.allocate(source, "PNG", "", preferred=source)
+    assert path.name == "keep_1.png"
+    names.release(path)
+    assert sorted(os.listdir(tmp_path)) == ["keep.png"]
+
+
+def test_journaled_claim_is_reused_but_not_deleted(tmp_path):
+    # An interrupted batch's journal recorded this claim; resuming reuses it
+    claim = tmp_path / "p0.png"
+    claim.touch()
+    names = OutputNames()
+    assert names.allocate("/a/p0.jpg", "PNG", tmp_path, preferred=claim) == claim
+    names.release(claim)
+    names.release_all() # Only files this batch created with O_EXCL are removed
+    assert claim.exists()
@@ -0,0 +1,60 @@
+"""Resuming an interrupted batch whose sources have several outputs."""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from Image_Conv_Batch import BatchRunner, ConversionPlan
+from Image_Conv_Engine import ConversionSettings, VariantSet
+from Image_Conv_Journal import BatchJournal, load_journal, plan_to_json
+
+
+def test_resume_converts_unfinished_variants(tmp_path):
+    source = tmp_path / "p0.png"
+    Image.radial_gradient("L").resize((800, 600)).convert("RGB").save(source)
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    variants = VariantSet([ConversionSettings("WEBP", size_mode="fit_width", width=width) for width in (320, 640)])
+    plan = ConversionPlan([(str(source), variants)], [], str(output_dir))
+
+    # Interrupted with the 320 px output finished and the 640 px one only claimed
+    small, large = output_dir / "p0_320w.webp", output_dir / "p0_640w.webp"
+    Image.new("RGB", (320, 240)).save(small)
+    large.touch()
+    journal_path = tmp_path / "journal.jsonl"
+    with open(journal_path, "w", encoding="utf-8") as f:
+        for record in (plan_to_json(plan),
+                       {"type": "start", "source": str(source), "output": str(small), "name": small.name},
+                       {"type": "done", "source": str(source), "ok": True, "name": small.name},
+                       {"type": "start", "source": str(source), "output": str(large), "name": large.name}):
+            f.write(json.dumps(record) + "\n")
+
+    plan, resume = load_journal(journal_path)
+    assert resume.finished_sources() == 1
+    runner = BatchRunner(1, plan.output_dir, journal=BatchJournal(journal_path), resume=resume)
+    result = runner.run(plan.files)
+
+    assert (result.successful, result.resumed, result.failed) == (1, 0, 0)
+    with Image.open(large) as img:
+        assert img.size == (640, 480)
+    assert sorted(os.listdir(output_dir)) == [".imgconv_manifest.jsonl", small.name, large.name]
+    assert not journal_path.exists() # Completed, so nothing is left to resume
+
+
+def test_resume_skips_source_with_every_variant_done(tmp_path):
+    source = tmp_path / "p0.png"
+    Image.new("RGB", (800, 600)).save(source)
+    variants = VariantSet([ConversionSettings("WEBP", size_mode="fit_width", width=width) for width in (320, 640)])
+    plan = ConversionPlan([(str(source), variants)], [], str(tmp_path))
+    journal_path = tmp_path / "journal.jsonl"
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(plan_to_json(plan)) + "\n")
+        for name in ("p0_320w.webp", "p0_640w.webp"):
+            f.write(json.dumps({"type": "done", "source": str(source), "ok": True, "name": name}) + "\n")
+
+    plan, resume = load_journal(journal_path)
+    result = BatchRunner(1, plan.output_dir, resume=resume).run(plan.files)
+    assert (result.successful, result.resumed) == (0, 1)
@@ -0,0 +1,113 @@
+"""Streaming resize: band by band, the same pixels as Image.resize."""
+import itertools
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageChops
+
+import Image_Conv_Stream
+from Image_Conv_Stream import band_source, open_unchecked, stream_resize
+
+SIZE = (180, 240)
+FORMATS = {
+    "tiff": ("TIFF", {}, ("1", "L", "LA", "I;16", "RGB", "RGBA", "CMYK")),
+    "tiff_packbits": ("TIFF", {"compression": "packbits", "strip_size": 2048}, ("L", "LA", "RGB", "RGBA", "CMYK")),
+    "tiff_deflate": ("TIFF", {"compression": "tiff_adobe_deflate", "strip_size": 2048},
+                     ("L", "LA", "RGB", "RGBA", "CMYK")),
+    "bmp": ("BMP", {}, ("1", "L", "RGB")),
+    "ppm": ("PPM", {}, ("1", "L", "RGB")),
+}
+FILTERS = ("NEAREST", "BOX", "BILINEAR", "HAMMING", "BICUBIC", "LANCZOS")
+GAPS = (None, 2.0, 3.0)
+# 240 rows to these heights is 4, 2.5, 8/3 and 6 source rows per output row:
+# every band can start on a whole source row, and the result is exact
+EXACT_SIZES = ((45, 60), (72, 96), (68, 90), (30, 40))
+# 240/67 source rows per output row only repeats every 67 output rows, more
+# than one band holds, so band edges fall between source rows
+INEXACT_SIZE = (51, 67)
+
+CASES = [(kind, mode) for kind, (_, _, modes) in FORMATS.items() for mode in modes]
+
+
+@pytest.fixture(autouse=True)
+def small_bands(monkeypatch):
+    # Several bands per image, each read from several row blocks
+    monkeypatch.setattr(Image_Conv_Stream, "BAND_BYTES", 26 * 1024)
+    monkeypatch.setattr(Image_Conv_Stream, "VIRTUAL_STRIP_BYTES", 2048)
+
+
+def make_source(tmp_path, kind, mode):
+    # Smooth colour with noise on top, and an alpha channel with many nearly
+    # transparent pixels, where premultiplied rounding shows most
+    rng = random.Random(11)
+    coarse = (SIZE[0] // 12, SIZE[1] // 12)
+    img = Image.frombytes("RGB", coarse, rng.randbytes(coarse[0] * coarse[1] * 3)).resize(SIZE, Image.BICUBIC)
+    img = Image.blend(img, Image.frombytes("RGB", SIZE, rng.randbytes(SIZE[0] * SIZE[1] * 3)), 0.25)
+    alpha = Image.frombytes("L", coarse, bytes(rng.choice((0, 1, 2, 5, 20, 128, 255))
+                                               for _ in range(coarse[0] * coarse[1]))).resize(SIZE, Image.BILINEAR)
+    if mode in ("LA", "RGBA"):
+        img = img.convert(mode[:-1])
+        img.putalpha(alpha)
+    elif mode == "I;16":
+        img = img.convert("L").point(lambda value: value * 257, "I").convert("I;16")
+    else:
+        img = img.convert(mode)
+    image_format, options, _ = FORMATS[kind]
+    path = tmp_path / f"source.{kind}"
+    img.save(path, image_format, **options)
+    return path
+
+
+def both_resized(path, size, resample, gap):
+    source = band_source(open_unchecked(path))
+    assert source is not None and len(source.blocks) > 1
+    streamed = stream_resize(source, size, resample, gap)
+    source.img.close()
+    with Image.open(path) as img:
+        whole = img.resize(size, Image.Resampling[resample], reducing_gap=gap)
+    assert (streamed.mode, streamed.size) == (whole.mode, whole.size)
+    return streamed, whole
+
+
+def gaps_for(mode):
+    return (None,) if mode == "I;16" else GAPS # Image.reduce has no I;16 support
+
+
+def max_difference(a, b):
+    if a.mode == "I;16":
+        return max(abs(x - y) for x, y in zip(memoryview(a.tobytes()).cast("H"), memoryview(b.tobytes()).cast("H")))
+    if a.mode in ("LA", "RGBA"):
+        # Compare the premultiplied values both were filtered as (converting
+        # back to them rounds once more)
+        a, b = a.convert(a.mode[:-1] + "a"), b.convert(b.mode[:-1] + "a")
+    extrema = ImageChops.difference(a, b).getextrema()
+    return max(high for _, high in (extrema if len(a.getbands()) > 1 else [extrema]))
+
+
+@pytest.mark.parametrize("kind, mode", CASES)
+def test_stream_resize_matches_whole_image(tmp_path, kind, mode):
+    path = make_source(tmp_path, kind, mode)
+    for size, resample, gap in itertools.product(EXACT_SIZES, FILTERS, gaps_for(mode)):
+        streamed, whole = both_resized(path, size, resample, gap)
+        if mode == "I;16":
+            # 16-bit filters sum in double precision; an exact tie can round either way
+            assert max_difference(streamed, whole) <= 1, (size, resample, gap)
+        else:
+            assert streamed.tobytes() == whole.tobytes(), (size, resample, gap)
+
+
+@pytest.mark.parametrize("kind, mode", CASES)
+def test_stream_resize_bound_between_source_rows(tmp_path, kind, mode):
+    # Band edges between source rows: NEAREST still picks the same rows, the
+    # smooth filters round at most 1 level apart (premultiplied, for alpha
+    # images). BOX isn't covered; a whole source row can move between boxes.
+    path = make_source(tmp_path, kind, mode)
+    for resample, gap in itertools.product(("NEAREST",) + FILTERS[2:], gaps_for(mode)):
+        streamed, whole = both_resized(path, INEXACT_SIZE, resample, gap)
+        bound = 0 if resample == "NEAREST" or mode == "1" else 2 if mode in ("LA", "RGBA") else 1
+        assert max_difference(streamed, whole) <= bound, (resample, gap)